@@ -1,101 +1,194 @@
-import psycopg2
+import argparse
 import os
+from datetime import date
 from dotenv import load_dotenv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 import distro
-from utils import software_updates
-from utils import filesystems_integrity
-from utils import bootloader_settings
-from utils import unused_filesystems
+from utils import facts
+from utils import snapshot
+from utils import evaluator
+from utils.evaluator import CHECK_MODULES
+from utils import watcher
+from utils import agent
+from utils import result_cache
+from utils import profiling
+from utils import database
+from utils import commands
+from utils import ingest
+from utils import jobs
+from utils import maintenance
+from utils import trends
+from utils import report
+from utils import report_cache
+from utils import query
+from utils import evidence
 load_dotenv()
 
-# Access the variables
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+def run_checks_and_generate_report(sections=None, show_profile=False, trace_file=None, workers=None):
+    profiling.start_run()
+    if trace_file:
+        profiling.start_trace()
 
+    # Collect every fact the selected checks need, once and in parallel;
+    # checks whose inputs are unchanged reuse their cached result instead
+    with profiling.traced("stage", "collect facts"):
+        facts.collect(facts.required_facts(result_cache.pending(evaluator.selected_checks(sections))))
 
-# Define PDF filename
-PDF_FILE = "cis_reports.pdf"
-
-def create_connection():
-    """Create a connection to the PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST
-        )
-        return conn
-    except psycopg2.Error as e:
-        print("Unable to connect to the database.")
-        print(e)
-        return None
-
-def fetch_data_from_db(table_name):
-    """Fetch data from the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute(f"SELECT * FROM {table_name}")
-            rows = cur.fetchall()
-            conn.close()
-            return rows
-        except psycopg2.Error as e:
-            print(f"Error fetching data from {table_name}.")
-            print(e)
-            conn.close()
-            return None
-
-def generate_report():
-    doc = SimpleDocTemplate(PDF_FILE, pagesize=letter)
-    elements = []
-
-    # Table headers
-    table_data = [["Hostname", "OS Footprint", "Date", "Section", "Section Name", "Scored", "Checklist", "Deviation"]]
-
-    # Fetch data from database and add to table
-    for table_name in ["software_updates", "filesystems_integrity", "bootloader_settings"]:
-        rows = fetch_data_from_db(table_name)
-        if rows:
-            for row in rows:
-                table_data.append(row)
-
-    # Create the table
-    table = Table(table_data)
-
-    # Add style to the table
-    style = TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black)])
-
-    table.setStyle(style)
-    elements.append(table)
-
-    # Build PDF document
-    doc.build(elements)
-    print(f"Report generated: {PDF_FILE}")
-
-def run_checks_and_generate_report():
     # Run all checks
-    unused_filesystem.run()
-    software_updates.run()
-    filesystems_integrity.run()
-    bootloader_settings.run()
-    
+    for module in CHECK_MODULES:
+        module.run(sections)
 
     # Generate report
-    generate_report()
+    with profiling.span("stage", "report"):
+        report.generate_report(workers=workers)
+
+    # Record what every check and collector cost
+    run = profiling.finish_run()
+    database.write_profile(run)
+    if show_profile:
+        profiling.print_summary(run)
+    if trace_file:
+        profiling.write_trace(trace_file)
+
+def collect_only(bundle_path, sections=None):
+    """Gather the raw facts the checks need into a bundle, without evaluating anything."""
+    fact_names = None
+    if sections:
+        fact_names = facts.required_facts(evaluator.selected_checks(sections))
+    bundle = snapshot.collect_snapshot(bundle_path, fact_names)
+    print(f"Snapshot written: {bundle_path} ({len(bundle['facts'])} facts)")
+    for name, error in bundle['errors'].items():
+        print(f"Error collecting {name}: {error}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the CIS benchmark checks and generate the PDF report.")
+    parser.add_argument("--sections", nargs="+", metavar="SECTION",
+                        help="only run these CIS sections, e.g. 1.1.1 1.4.2 (a section selects its subsections)")
+    parser.add_argument("--collect-only", metavar="BUNDLE",
+                        help="only collect host facts into a compressed snapshot bundle; no evaluation, database or report")
+    parser.add_argument("--evaluate-bundles", metavar="DIR",
+                        help="evaluate every snapshot bundle (*.json.gz) in DIR and bulk load the results")
+    parser.add_argument("--root", nargs="+", metavar="ROOT",
+                        help="scan mounted images or extracted container filesystems instead of this host")
+    parser.add_argument("--watch", action="store_true",
+                        help="evaluate once, then keep running and re-evaluate only the checks whose inputs change")
+    parser.add_argument("--agent", action="store_true",
+                        help="stay resident and run the benchmark on a schedule, with a warm database pool")
+    parser.add_argument("--interval", type=int, default=86400,
+                        help="seconds between scheduled agent runs (default: 86400)")
+    parser.add_argument("--jitter", type=int, default=3600,
+                        help="random delay of up to this many seconds added to each agent run (default: 3600)")
+    parser.add_argument("--socket", default=agent.CONTROL_SOCKET,
+                        help=f"agent control socket (default: {agent.CONTROL_SOCKET})")
+    parser.add_argument("--trigger", action="store_true",
+                        help="ask a running agent to run now (limited to --sections if given) and print its results")
+    parser.add_argument("--ingest-server", metavar="[HOST:]PORT",
+                        help="accept result batches from agents over HTTP and bulk load them into PostgreSQL")
+    parser.add_argument("--ingest-url", metavar="URL",
+                        help="send agent results to an ingestion server instead of connecting to PostgreSQL")
+    parser.add_argument("--query-server", metavar="[HOST:]PORT",
+                        help="serve read-only JSON views of the results over HTTP (host status, section compliance, deviations)")
+    parser.add_argument("--enqueue-bundles", metavar="DIR",
+                        help="queue one job per snapshot bundle in DIR for --work processes on any machine")
+    parser.add_argument("--enqueue-roots", nargs="+", metavar="ROOT",
+                        help="queue one scan job per root filesystem for --work processes")
+    parser.add_argument("--work", action="store_true",
+                        help="claim and run queued scan jobs (one process per --workers)")
+    parser.add_argument("--until-empty", action="store_true",
+                        help="with --work, exit once the queue is empty instead of waiting for more jobs")
+    parser.add_argument("--diff", action="store_true",
+                        help="list sections that became deviated or compliant per host since the previous run (or --since)")
+    parser.add_argument("--trend", action="store_true",
+                        help="print the fleet's daily compliance rate per section since --since (default: 30 days)")
+    parser.add_argument("--since", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="with --diff, compare the state on this date with --until; with --trend, start here")
+    parser.add_argument("--until", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="with --diff, the later date (default: today)")
+    parser.add_argument("--pdf", metavar="FILE",
+                        help="with --diff, also render the changed rows to a PDF")
+    parser.add_argument("--maintain", action="store_true",
+                        help="roll old daily results into weekly/monthly summaries, prune them and vacuum the tables")
+    parser.add_argument("--keep-days", type=int, default=maintenance.KEEP_DAYS,
+                        help=f"with --maintain, daily results to keep (default: {maintenance.KEEP_DAYS})")
+    parser.add_argument("--keep-weeks", type=int, default=maintenance.KEEP_WEEKS,
+                        help=f"with --maintain, weekly summaries to keep (default: {maintenance.KEEP_WEEKS})")
+    parser.add_argument("--reindex", action="store_true",
+                        help="with --maintain, also rebuild the tables' indexes (REINDEX CONCURRENTLY)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for --evaluate-bundles, --root, --work and the report (default: one per CPU)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print a ranked summary of the time each check and collector took")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace-event timeline of the run (checks, collectors, subprocesses, database writes, report)")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record-cassette", metavar="FILE",
+                          help="record every command the collectors run, with its output and exit code, "
+                               "and the facts read from host files to FILE")
+    cassette.add_argument("--replay-cassette", metavar="FILE",
+                          help="serve command output and host facts from a recorded cassette instead of running "
+                               "or reading anything")
+    parser.add_argument("--evidence-lines", type=int, default=evidence.EVIDENCE_LINES,
+                        help=f"offending paths or mounts kept and printed per check; the rest are only counted "
+                             f"(default: {evidence.EVIDENCE_LINES})")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop the world-writable and removable-media scans at the first violation and record "
+                             "\"Deviated (early exit)\" (a pass/fail verdict for deployment gates)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="evaluate every check and render the whole report even if nothing changed since the last run")
+    parser.add_argument("--cache-ttl", type=int, default=result_cache.CACHE_TTL,
+                        help=f"re-evaluate cached results older than this many seconds (default: {result_cache.CACHE_TTL})")
+    parser.add_argument("--report-cache-mb", type=int, default=report_cache.CACHE_BYTES // 1048576,
+                        help=f"keep at most this many MB of rendered reports in {report_cache.CACHE_DIR} "
+                             f"(default: {report_cache.CACHE_BYTES // 1048576})")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    run_checks_and_generate_report()
-
+    args = parse_args()
+    if args.record_cassette:
+        commands.record_cassette(args.record_cassette)
+    elif args.replay_cassette:
+        commands.replay_cassette(args.replay_cassette)
+    evidence.EVIDENCE_LINES = args.evidence_lines
+    evidence.FAIL_FAST = args.fail_fast
+    # A recorded run has to collect every fact for the cassette, and a replayed
+    # one has to evaluate what the cassette says, not reuse cached results
+    result_cache.configure(enabled=not (args.no_cache or args.record_cassette or args.replay_cassette),
+                           ttl=args.cache_ttl)
+    report_cache.configure(enabled=not args.no_cache, max_bytes=args.report_cache_mb * 1048576)
+    try:
+        if args.collect_only:
+            collect_only(args.collect_only, args.sections)
+        elif args.evaluate_bundles:
+            evaluator.evaluate_bundles(args.evaluate_bundles, args.sections, args.workers)
+        elif args.root:
+            evaluator.scan_roots(args.root, args.sections, args.workers)
+        elif args.watch:
+            watcher.watch(args.sections)
+        elif args.agent:
+            agent.Agent(args.sections, args.interval, args.jitter, ingest_url=args.ingest_url).serve(args.socket)
+        elif args.enqueue_bundles:
+            jobs.enqueue("bundle", evaluator.find_bundles(args.enqueue_bundles), args.sections)
+        elif args.enqueue_roots:
+            jobs.enqueue("root", [os.path.abspath(root) for root in args.enqueue_roots], args.sections)
+        elif args.work:
+            jobs.run_workers(args.workers, once=args.until_empty)
+        elif args.maintain:
+            maintenance.maintain(args.keep_days, args.keep_weeks, args.reindex)
+        elif args.diff:
+            rows = trends.changes(args.since, args.until, args.sections)
+            trends.print_changes(rows)
+            if args.pdf:
+                trends.write_changes_pdf(rows, args.pdf)
+        elif args.trend:
+            trends.print_trend(trends.trend(args.since, args.sections))
+        elif args.ingest_server:
+            host, _, port = args.ingest_server.rpartition(":")
+            ingest.serve(host or "0.0.0.0", int(port))
+        elif args.query_server:
+            host, _, port = args.query_server.rpartition(":")
+            query.serve(host or "127.0.0.1", int(port))
+        elif args.trigger:
+            print(agent.send_command(" ".join(["run"] + (args.sections or [])), args.socket), end="")
+        else:
+            run_checks_and_generate_report(args.sections, args.profile, args.trace, args.workers)
+    finally:
+        commands.save_cassette()
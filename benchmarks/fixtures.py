@@ -0,0 +1,147 @@
+"""Synthetic host fixtures for the benchmark suite.
+
+Everything is generated from a fixed seed, so two runs with the same sizes
+build identical inputs.
+"""
+import os
+import random
+
+from utils.collectors import KERNEL_MODULES, SYSTEMD_UNITS
+
+SEED = 1
+
+
+def _command_result(command, stdout="", stderr="", returncode=0):
+    return {'command': command, 'stdout': stdout, 'stderr': stderr, 'returncode': returncode}
+
+
+def make_mountinfo(mounts):
+    """/proc/self/mountinfo text with the usual system mounts plus many bind
+    and overlay mounts (container hosts easily have thousands)."""
+    rng = random.Random(SEED)
+    lines = [
+        "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw,errors=remount-ro",
+        "23 22 0:21 / /proc rw,nosuid,nodev,noexec,relatime shared:12 - proc proc rw",
+        "24 22 0:22 / /sys rw,nosuid,nodev,noexec,relatime shared:7 - sysfs sysfs rw",
+        "25 22 0:5 / /dev rw,nosuid,relatime shared:2 - devtmpfs udev rw,size=8039256k,mode=755",
+        "26 25 0:23 / /dev/shm rw,nosuid,nodev shared:3 - tmpfs tmpfs rw",
+        "27 22 0:24 / /tmp rw,nosuid,nodev,noexec,relatime shared:4 - tmpfs tmpfs rw",
+        "28 27 0:24 / /var/tmp rw,nosuid,nodev,noexec,relatime shared:4 - tmpfs tmpfs rw",
+        "29 22 8:2 / /home rw,nodev,relatime shared:5 - ext4 /dev/sda2 rw",
+        "30 22 8:3 / /var rw,relatime shared:6 - ext4 /dev/sda3 rw",
+    ]
+    for mount_id in range(100, 100 + mounts):
+        container = f"{rng.getrandbits(64):016x}"
+        if mount_id % 2:
+            lines.append(f"{mount_id} 30 0:{mount_id} / /var/lib/docker/overlay2/{container}/merged "
+                         f"rw,relatime - overlay overlay rw,lowerdir=/var/lib/docker/overlay2/l/{container}")
+        else:
+            lines.append(f"{mount_id} 30 0:{mount_id} / /run/containers/{container}/shm "
+                         f"rw,nosuid,nodev,noexec,relatime - tmpfs shm rw,size=65536k")
+    return "\n".join(lines) + "\n"
+
+
+def make_dpkg_status(packages):
+    """A dpkg status file with the given number of installed packages (AIDE among them)."""
+    rng = random.Random(SEED)
+    paragraphs = []
+    for index in range(packages):
+        name = "aide" if index == packages // 2 else f"package-{index:05d}"
+        paragraphs.append("\n".join([
+            f"Package: {name}",
+            "Status: install ok installed",
+            "Priority: optional",
+            "Section: misc",
+            f"Installed-Size: {rng.randint(10, 50000)}",
+            "Maintainer: Synthetic Fixtures <fixtures@example.invalid>",
+            "Architecture: amd64",
+            f"Version: {rng.randint(0, 9)}.{rng.randint(0, 99)}-{rng.randint(1, 9)}",
+            "Depends: libc6 (>= 2.34)",
+            f"Description: synthetic package {index}",
+            " Generated for the benchmark suite.",
+        ]))
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def make_tree(root, entries, fanout=100):
+    """A directory tree with about `entries` inodes. A few directories are
+    world-writable without the sticky bit and a few files are setuid."""
+    created = 0
+    level = [root]
+    os.makedirs(root, exist_ok=True)
+    while created < entries:
+        next_level = []
+        for directory in level:
+            for index in range(fanout):
+                if created >= entries:
+                    break
+                path = os.path.join(directory, f"e{index:03d}")
+                if index % 10 == 0:
+                    os.mkdir(path)
+                    next_level.append(path)
+                    if created % 997 == 0:
+                        os.chmod(path, 0o777)
+                else:
+                    with open(path, "w"):
+                        pass
+                    if created % 1009 == 0:
+                        os.chmod(path, 0o4755)
+                created += 1
+        if not next_level:
+            break
+        level = next_level
+    return created
+
+
+def _write(root, path, text, mode=0o644):
+    target = os.path.join(root, path.lstrip("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w") as handle:
+        handle.write(text)
+    os.chmod(target, mode)
+
+
+def make_root(root, packages, tree_entries):
+    """An extracted rootfs as --root would scan it."""
+    _write(root, "/etc/os-release", 'ID=ubuntu\nVERSION_ID="22.04"\nVERSION_CODENAME=jammy\n')
+    _write(root, "/etc/fstab", "/dev/sda1 / ext4 errors=remount-ro 0 1\n"
+                               "tmpfs /tmp tmpfs defaults,nodev,nosuid,noexec 0 0\n"
+                               "/dev/sda2 /home ext4 defaults,nodev 0 2\n")
+    _write(root, "/etc/modprobe.d/CIS.conf", "".join(f"install {module} /bin/true\n" for module in KERNEL_MODULES))
+    _write(root, "/var/lib/dpkg/status", make_dpkg_status(packages))
+    _write(root, "/boot/grub/grub.cfg", 'set superusers="root"\n'
+                                        "password_pbkdf2 root grub.pbkdf2.sha512.10000.00FF\n", 0o400)
+    _write(root, "/etc/shadow", "root:*:19000:0:99999:7:::\n", 0o640)
+    _write(root, "/etc/passwd", "root:x:0:0:root:/root:/bin/bash\n")
+    _write(root, "/etc/group", "root:x:0:\n")
+    _write(root, "/etc/crontab", "0 5 * * * root /usr/bin/aide --config /etc/aide/aide.conf --check\n")
+    return make_tree(os.path.join(root, "srv", "tree"), tree_entries)
+
+
+def make_facts(mount_table, inventory, walk_result):
+    """A complete fact set, shaped like the collectors' output, around the
+    generated mount table, package inventory and filesystem walk."""
+    modprobe = "install /bin/true"
+    return {
+        'host': {'hostname': "bench-host", 'os_footprint': "ubuntu 22.04 jammy"},
+        'mount_table': mount_table,
+        'fstab': ["tmpfs /tmp tmpfs defaults,nodev,nosuid,noexec 0 0"],
+        'module_state': {
+            'modules': {module: {'modprobe': _command_result(f"modprobe -n -v {module}", modprobe), 'lsmod': ""}
+                        for module in KERNEL_MODULES},
+            'modprobe_d': {"/etc/modprobe.d/CIS.conf": "".join(f"install {module} /bin/true\n" for module in KERNEL_MODULES)}
+        },
+        'unit_state': {unit: {'is_enabled': _command_result(f"systemctl is-enabled {unit}", "disabled", returncode=1),
+                              'status': _command_result(f"systemctl status {unit}", "inactive (dead)", returncode=3)}
+                       for unit in SYSTEMD_UNITS},
+        'package_inventory': inventory,
+        'package_repos': {'apt': _command_result("apt-cache policy", "Package files:\n 500 http://archive.ubuntu.com/ubuntu jammy/main amd64 Packages")},
+        'gpg_keys': {'apt': _command_result("apt-key list", "pub   rsa4096 2018-09-17 [SC]\nuid   Ubuntu Archive Automatic Signing Key")},
+        'grub': {'path': "/boot/grub/grub.cfg", 'mode': 0o400, 'uid': 0, 'gid': 0, 'superusers': ["root"],
+                 'passwords': [{'directive': "password_pbkdf2", 'user': "root"}], 'user_cfg': None,
+                 'grub2_password': False, 'errors': []},
+        'shadow': {'path': "/etc/shadow", 'root_locked': True, 'error': ""},
+        'crontabs': {'root_crontab': _command_result("crontab -u root -l", "0 5 * * * /usr/bin/aide --check"), 'files': {}},
+        'local_filesystems': walk_result['roots'],
+        'filesystem_walk': walk_result
+    }
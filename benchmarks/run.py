@@ -0,0 +1,169 @@
+"""Benchmark suite for the check engine.
+
+Builds synthetic fixtures (a mount table with thousands of mounts, a dpkg
+status file with thousands of packages, a large directory tree and a rootfs
+around them), measures wall time, peak memory and subprocesses for each
+case and per-check latency, and compares them with a stored baseline.
+
+    python -m benchmarks.run                    # compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline    # record a new baseline
+    python -m benchmarks.run --tree-entries 2000000
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import fixtures
+from utils import collectors
+from utils import evaluator
+from utils import fs_walker
+from utils import profiling
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A case regresses when it is this much slower (or bigger) than its baseline.
+TOLERANCE = 1.25
+
+# Per-check latencies below this are noise.
+MIN_CHECK_SECONDS = 0.001
+
+
+def measure(func, repeat=3):
+    """Best wall time of `repeat` calls, then one more call under tracemalloc
+    for the peak memory and the subprocess count."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    profiling.start_run()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    subprocesses = sum(entry['subprocesses'] for entry in profiling.profile()['spans'])
+    return {'wall_seconds': round(best, 6), 'peak_bytes': peak, 'subprocesses': subprocesses}
+
+
+def check_latencies(fact_values, repeat=3):
+    """Best latency of every check against a loaded fact set."""
+    best = {}
+    for _ in range(repeat):
+        profiling.start_run()
+        evaluator.evaluate_facts(fact_values, "2024-01-01")
+        for entry in profiling.profile()['spans']:
+            if entry['kind'] == "check":
+                best[entry['name']] = min(best.get(entry['name'], entry['wall_seconds']), entry['wall_seconds'])
+    return {section: round(seconds, 6) for section, seconds in sorted(best.items())}
+
+
+def run_suite(workdir, mounts, packages, tree_entries, repeat):
+    mountinfo = fixtures.make_mountinfo(mounts)
+    dpkg_status = fixtures.make_dpkg_status(packages)
+    root = os.path.join(workdir, "rootfs")
+    created = fixtures.make_root(root, packages, tree_entries)
+    tree = os.path.join(root, "srv", "tree")
+    print(f"Fixtures: {mounts} mounts, {packages} packages, {created} tree entries under {workdir}", file=sys.stderr)
+
+    mount_table = collectors.parse_mountinfo(mountinfo)
+    inventory = {'manager': 'dpkg', 'packages': collectors.parse_dpkg_status(dpkg_status)}
+    walk_result = fs_walker.walk([tree], known_uids={os.getuid()}, known_gids={os.getgid()})
+    fact_values = fixtures.make_facts(mount_table, inventory, walk_result)
+
+    cases = {
+        'parse_mountinfo': lambda: collectors.parse_mountinfo(mountinfo),
+        'parse_dpkg_status': lambda: collectors.parse_dpkg_status(dpkg_status),
+        'filesystem_walk': lambda: fs_walker.walk([tree], known_uids={os.getuid()}, known_gids={os.getgid()}),
+        'evaluate_checks': lambda: evaluator.evaluate_facts(fact_values, "2024-01-01"),
+        'scan_root': lambda: evaluator.scan_root(root),
+    }
+    results = {'cases': {}, 'checks': {}}
+    for name, func in cases.items():
+        results['cases'][name] = measure(func, repeat)
+        print(f"  {name} done", file=sys.stderr)
+    results['checks'] = check_latencies(fact_values, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Lines describing every measurement that regressed against the baseline."""
+    regressions = []
+    for name, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous:
+            continue
+        for metric in ("wall_seconds", "peak_bytes"):
+            if current[metric] > previous[metric] * tolerance:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if current['subprocesses'] > previous['subprocesses']:
+            regressions.append(f"{name}: subprocesses {previous['subprocesses']} -> {current['subprocesses']}")
+    for section, seconds in results['checks'].items():
+        previous = baseline.get('checks', {}).get(section)
+        if previous is not None and seconds > max(previous, MIN_CHECK_SECONDS) * tolerance:
+            regressions.append(f"check {section}: {previous}s -> {seconds}s")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the check engine against synthetic fixtures.")
+    parser.add_argument("--mounts", type=int, default=5000, help="mounts in the synthetic mount table (default: 5000)")
+    parser.add_argument("--packages", type=int, default=5000, help="packages in the synthetic dpkg status (default: 5000)")
+    parser.add_argument("--tree-entries", type=int, default=200000,
+                        help="inodes in the synthetic directory tree (default: 200000)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed repetitions per case; the best is kept (default: 3)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"allowed slowdown factor before a case counts as a regression (default: {TOLERANCE})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="cis-bench-") as workdir:
+        # The checks print their evidence; only the suite's own output is wanted here.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run_suite(workdir, args.mounts, args.packages, args.tree_entries, args.repeat)
+    results['parameters'] = {'mounts': args.mounts, 'packages': args.packages, 'tree_entries': args.tree_entries}
+
+    for name, case in results['cases'].items():
+        print(f"{name:<20} {case['wall_seconds']:>9.4f}s {case['peak_bytes'] / 1048576:>8.1f} MiB "
+              f"{case['subprocesses']:>4} subprocesses")
+    slowest = sorted(results['checks'].items(), key=lambda item: item[1], reverse=True)[:5]
+    print("Slowest checks: " + ", ".join(f"{section} {seconds * 1000:.2f}ms" for section, seconds in slowest))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as handle:
+            json.dump(results, handle, indent=1, sort_keys=True)
+        print(f"Baseline written: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    except OSError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        return 0
+    if baseline.get('parameters') != results['parameters']:
+        print(f"Baseline was recorded with {baseline.get('parameters')}; not comparing.")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print("Regression:", line)
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
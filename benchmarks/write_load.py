@@ -0,0 +1,216 @@
+"""Load test for the results write path: thousands of synthetic hosts, each
+reporting every check, replayed at a configurable concurrency the way a
+fleet reports in the same minute.
+
+Rows follow the real tables and sections. They are written to the same
+table names inside a scratch schema (dropped afterwards unless --keep), so
+the results tables are never touched. The test reports throughput, latency
+percentiles per host, lock waits sampled from pg_stat_activity, deadlocks,
+and dead tuples and size per table.
+
+Needs a PostgreSQL reachable with the usual DB_* settings.
+
+    python -m benchmarks.write_load --hosts 5000 --writers 64
+    python -m benchmarks.write_load --mode copy --staging unlogged --rounds 3
+    python -m benchmarks.write_load --overlap 0.5    # hosts written by several writers at once
+    python -m benchmarks.write_load --ingest-url http://localhost:8470
+"""
+import argparse
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+from utils import database
+from utils import evaluator
+from utils import ingest
+
+SCRATCH_SCHEMA = "cis_load_test"
+
+# How often lock waits are sampled while the load runs.
+SAMPLE_INTERVAL = 0.1
+
+# Chance that a synthetic host's check result differs from the fleet-wide one.
+DEVIATION_RATE = 0.1
+
+
+def fleet_checks():
+    """(table, section) of every check, as the check modules would write them."""
+    return [(evaluator.module_table(func), func.section) for func in evaluator.selected_checks()]
+
+
+def host_results(host, checks, day, rng):
+    """One host's results, grouped by table."""
+    hostname = f"load-host-{host:06d}"
+    footprint = rng.choice(("ubuntu 22.04 jammy", "ubuntu 20.04 focal", "debian 12 bookworm"))
+    results = {}
+    for table, section in checks:
+        compliant = (zlib.crc32(section.encode()) % 3 != 0) != (rng.random() < DEVIATION_RATE)
+        results.setdefault(table, []).append((
+            hostname, footprint, day, section, f"Synthetic result for {section}", "Scored",
+            "Compliant" if compliant else "Not Compliant", "Not Deviated" if compliant else "Deviated"))
+    return results
+
+
+def assign_hosts(hosts, writers, overlap, seed=1):
+    """Hosts per writer. With overlap > 0 that share of hosts is also given to a
+    second writer, so concurrent upserts hit the same rows."""
+    rng = random.Random(seed)
+    queues = [[] for _ in range(writers)]
+    for host in range(hosts):
+        queues[host % writers].append(host)
+        if writers > 1 and rng.random() < overlap:
+            queues[(host + 1 + rng.randrange(writers - 1)) % writers].append(host)
+    for queue in queues:
+        rng.shuffle(queue)
+    return queues
+
+
+def writer(queue, checks, day, bulk, ingest_url, stats, seed):
+    rng = random.Random(seed)
+    for host in queue:
+        results = host_results(host, checks, day, rng)
+        rows = sum(len(table_rows) for table_rows in results.values())
+        started = time.perf_counter()
+        if ingest_url:
+            ok = ingest.send_rows(ingest_url, [(table, row) for table, table_rows in results.items() for row in table_rows])
+        else:
+            ok = all([database.write_rows(table, table_rows, bulk=bulk) for table, table_rows in results.items()])
+        elapsed = time.perf_counter() - started
+        with stats['lock']:
+            stats['latencies'].append(elapsed)
+            stats['rows' if ok else 'failed'] += rows
+
+
+class LockSampler(threading.Thread):
+    """Counts sessions waiting on a lock in this database, every SAMPLE_INTERVAL."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.conn = database.connect()
+        self.conn.autocommit = True
+        self.samples = []
+        self.stopping = threading.Event()
+
+    def deadlocks(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+    def run(self):
+        cursor = self.conn.cursor()
+        while not self.stopping.wait(SAMPLE_INTERVAL):
+            cursor.execute("""
+            SELECT count(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND wait_event_type = 'Lock'
+            """)
+            self.samples.append(cursor.fetchone()[0])
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+def table_stats(conn, schema):
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_stat_clear_snapshot()")
+    cursor.execute("""
+    SELECT relname, n_live_tup, n_dead_tup, pg_total_relation_size(relid)
+    FROM pg_stat_user_tables WHERE schemaname = %s ORDER BY relname
+    """, (schema,))
+    return cursor.fetchall()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def run_load(writers, hosts, bulk, overlap, rounds, ingest_url=None):
+    checks = fleet_checks()
+    stats = {'lock': threading.Lock(), 'latencies': [], 'rows': 0, 'failed': 0}
+    queues = assign_hosts(hosts, writers, overlap)
+    started = time.perf_counter()
+    for round_number in range(rounds):
+        # Even rounds report a new day (inserts); odd rounds re-run the same day (upserts that update).
+        day = (date.today() - timedelta(days=rounds - round_number // 2)).isoformat()
+        threads = [threading.Thread(target=writer, args=(queue, checks, day, bulk, ingest_url, stats, index))
+                   for index, queue in enumerate(queues)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def report(args, stats, sampler, deadlocks, tables):
+    latencies = stats['latencies']
+    print(f"{args.hosts} hosts x {len(fleet_checks())} checks x {args.rounds} rounds, {args.writers} writers, "
+          + (f"via {args.ingest_url}" if args.ingest_url else f"mode {args.mode}"
+             + (f" ({args.staging} staging)" if args.mode == "copy" else "")))
+    print(f"Throughput: {stats['rows']} rows in {stats['seconds']:.2f}s = {stats['rows'] / stats['seconds']:.0f} rows/s"
+          + (f" ({stats['failed']} rows failed)" if stats['failed'] else ""))
+    print("Latency per host: " + ", ".join(f"p{int(fraction * 100)} {percentile(latencies, fraction) * 1000:.1f}ms"
+                                            for fraction in (0.5, 0.9, 0.99))
+          + f", max {max(latencies, default=0) * 1000:.1f}ms")
+    waiting = [sample for sample in sampler.samples if sample]
+    print(f"Lock waits: sessions waiting in {len(waiting)} of {len(sampler.samples)} samples, "
+          f"at most {max(sampler.samples, default=0)} at once; {deadlocks} deadlocks")
+    print(f"{'table':<28} {'live rows':>10} {'dead rows':>10} {'dead %':>7} {'size':>10}")
+    for name, live, dead, size in tables:
+        share = 100 * dead / (live + dead) if live + dead else 0
+        print(f"{name:<28} {live:>10} {dead:>10} {share:>6.1f}% {size / 1048576:>8.1f}MB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay synthetic fleet results against the write path.")
+    parser.add_argument("--hosts", type=int, default=1000, help="synthetic hosts (default: 1000)")
+    parser.add_argument("--writers", type=int, default=16, help="concurrent writers (default: 16)")
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="reporting rounds; every second round repeats the previous day (default: 2)")
+    parser.add_argument("--mode", choices=("upsert", "copy"), default="upsert",
+                        help="batched INSERT ... ON CONFLICT, or COPY through a staging table (default: upsert)")
+    parser.add_argument("--staging", choices=("temp", "unlogged"), default=database.STAGING,
+                        help=f"staging table for --mode copy (default: {database.STAGING})")
+    parser.add_argument("--overlap", type=float, default=0.0,
+                        help="share of hosts also written by a second writer at the same time (default: 0)")
+    parser.add_argument("--ingest-url", metavar="URL",
+                        help="send batches to an ingestion server instead (it must use the same scratch schema)")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCRATCH_SCHEMA} schema afterwards")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    database.STAGING = args.staging
+    # Every connection opened from here on (pool included) resolves the
+    # results tables inside the scratch schema.
+    setup = database.connect()
+    setup.autocommit = True
+    setup.cursor().execute(f"CREATE SCHEMA IF NOT EXISTS {SCRATCH_SCHEMA}")
+    os.environ["PGOPTIONS"] = f"-c search_path={SCRATCH_SCHEMA}"
+
+    database.enable_pool(args.writers, args.writers)
+    sampler = LockSampler()
+    deadlocks = sampler.deadlocks()
+    sampler.start()
+    try:
+        stats = run_load(args.writers, args.hosts, args.mode == "copy", args.overlap, args.rounds, args.ingest_url)
+    finally:
+        sampler.stop()
+        database.close_pool()
+    deadlocks = sampler.deadlocks() - deadlocks
+    time.sleep(1)  # table statistics reach pg_stat_user_tables asynchronously
+    report(args, stats, sampler, deadlocks, table_stats(setup, SCRATCH_SCHEMA))
+
+    if not args.keep:
+        setup.cursor().execute(f"DROP SCHEMA {SCRATCH_SCHEMA} CASCADE")
+    setup.close()
+    sampler.conn.close()
+
+
+if __name__ == "__main__":
+    main()
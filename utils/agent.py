@@ -0,0 +1,148 @@
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+from utils import database
+from utils import evaluator
+from utils import facts
+from utils import ingest
+from utils import profiling
+from utils import result_cache
+from utils import results
+
+CONTROL_SOCKET = "/run/cis-benchmark.sock"
+
+# Facts younger than this are reused by the next run (e.g. an on-demand run
+# right after a scheduled one); older ones are collected again.
+FACT_MAX_AGE = 300
+
+
+class Agent:
+    """Resident benchmark process: warm DB pool, cached facts, scheduled runs."""
+
+    def __init__(self, sections=None, interval=86400, jitter=3600, fact_max_age=FACT_MAX_AGE, ingest_url=None):
+        self.sections = sections
+        self.ingest_url = ingest_url
+        self.interval = interval
+        self.jitter = jitter
+        self.fact_max_age = fact_max_age
+        self.run_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.last_run = None
+
+    def run_once(self, sections=None):
+        """Evaluate the selected checks and write their results in one batch per table."""
+        with self.run_lock:
+            started = time.monotonic()
+            profiling.start_run()
+            checks = evaluator.selected_checks(sections or self.sections)
+            facts.expire(self.fact_max_age)
+            facts.collect(facts.required_facts(result_cache.pending(checks)))
+            rows, skipped = evaluator.capture_checks(checks)
+
+            if self.ingest_url:
+                ingest.send_rows(self.ingest_url, rows)
+            else:
+                results.write(rows)
+            run = profiling.finish_run()
+            if not self.ingest_url:
+                database.write_profile(run)
+
+            self.last_run = {
+                'finished': datetime.now().isoformat(timespec="seconds"),
+                'seconds': round(time.monotonic() - started, 3),
+                'results': len(rows),
+                'skipped': skipped
+            }
+            print(f"Run finished at {self.last_run['finished']}: {len(rows)} results in {self.last_run['seconds']}s")
+            return rows
+
+    def next_delay(self):
+        # Spread the fleet's runs so hosts don't all write to Postgres at once.
+        return self.interval + random.uniform(0, self.jitter)
+
+    def schedule(self):
+        delay = random.uniform(0, self.jitter)
+        while not self.stopping.wait(delay):
+            try:
+                self.run_once()
+            except Exception as error:
+                print("Error:", error)
+            delay = self.next_delay()
+
+    def serve(self, socket_path=CONTROL_SOCKET):
+        if not self.ingest_url:
+            database.enable_pool()
+        server = ControlServer(socket_path, self)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Agent listening on {socket_path}; running every {self.interval}s (+ up to {self.jitter}s jitter)")
+        try:
+            self.schedule()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopping.set()
+            server.shutdown()
+            server.server_close()
+            database.close_pool()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """One command per line:
+
+    run [SECTION ...]   run now and reply with one line per result
+    status              when the last run finished and how long it took
+    refresh             drop cached facts so the next run collects everything
+    """
+
+    def handle(self):
+        agent = self.server.agent
+        words = self.rfile.readline().decode().split()
+        command, arguments = (words[0], words[1:]) if words else ("", [])
+
+        if command == "run":
+            rows = agent.run_once(arguments or None)
+            for _, row in rows:
+                self.reply(f"{row[3]}\t{row[6]}\t{row[4]}")
+            self.reply(f"ok {len(rows)} results")
+        elif command == "status":
+            self.reply(f"ok {agent.last_run}")
+        elif command == "refresh":
+            facts.reset()
+            self.reply("ok")
+        else:
+            self.reply(f"error unknown command: {command}")
+
+    def reply(self, line):
+        self.wfile.write((line + "\n").encode())
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, agent):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.agent = agent
+        super().__init__(socket_path, ControlHandler)
+        os.chmod(socket_path, 0o600)
+
+
+def send_command(command, socket_path=CONTROL_SOCKET):
+    """Send one command to a running agent and return its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((command + "\n").encode())
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode()
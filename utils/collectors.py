@@ -0,0 +1,336 @@
+import glob
+import os
+import socket
+
+import distro
+
+from utils import evidence
+from utils.commands import run_command
+from utils.facts import collector, host_path, is_live
+from utils.fs_walker import NON_LOCAL_FSTYPES, walk
+from utils.grub_config import GRUB_CONFIG_PATHS, load_grub_config
+
+# Kernel modules audited by 1.1.1.x and 1.1.23.
+KERNEL_MODULES = ["cramfs", "freevxfs", "jffs2", "hfs", "hfsplus", "squashfs", "udf", "vfat", "usb-storage"]
+
+# Systemd units audited by 1.1.2, 1.1.22 and 1.3.2.
+SYSTEMD_UNITS = ["tmp.mount", "autofs", "aidcheck.service", "aidcheck.timer"]
+
+MODPROBE_DIRS = ["/etc/modprobe.d", "/lib/modprobe.d", "/usr/lib/modprobe.d", "/run/modprobe.d"]
+
+CRON_FILES = ["/etc/crontab", "/etc/cron.d/*", "/etc/cron.hourly/*", "/etc/cron.daily/*",
+              "/etc/cron.weekly/*", "/etc/cron.monthly/*"]
+
+PACKAGE_REPO_COMMANDS = {
+    'yum': 'yum repolist',
+    'apt': 'apt-cache policy',
+    'zypper': 'zypper repos'
+}
+
+GPG_KEY_COMMANDS = {
+    'rpm': "rpm -q gpg-pubkey --qf '%{name}-%{version}-%{release} --> %{summary}\\n'",
+    'apt': 'apt-key list',
+    'zypper': 'zypper repos'
+}
+
+DPKG_STATUS = "/var/lib/dpkg/status"
+SHADOW_FILE = "/etc/shadow"
+
+# Where root's crontab lives when it cannot be read with `crontab -l` (alternate roots).
+ROOT_CRONTAB_FILES = ["/var/spool/cron/crontabs/root", "/var/spool/cron/root"]
+
+MOUNTINFO = "/proc/self/mountinfo"
+
+# The walk facts checks read. A fail-fast walk looks for nothing else, so it
+# can stop as soon as each of them has a match.
+CHECKED_WALK_FACTS = ["world_writable_dirs_without_sticky"]
+
+# Host paths each fact is computed from. When none of them changed, neither
+# did the fact (the watcher and the result cache rely on this). Facts missing
+# here (the filesystem walk) cannot be tracked this cheaply.
+FACT_INPUTS = {
+    'host': ["/etc/hostname", "/etc/os-release"],
+    'mount_table': [MOUNTINFO],
+    'local_filesystems': [MOUNTINFO],
+    'fstab': ["/etc/fstab"],
+    'module_state': MODPROBE_DIRS + ["/proc/modules"],
+    'unit_state': ["/etc/systemd/system", "/lib/systemd/system", "/usr/lib/systemd/system", "/run/systemd/system"],
+    'package_inventory': [DPKG_STATUS, "/var/lib/rpm"],
+    'package_repos': ["/etc/apt/sources.list", "/etc/apt/sources.list.d", "/etc/yum.repos.d", "/etc/zypp/repos.d"],
+    'gpg_keys': ["/etc/apt/trusted.gpg", "/etc/apt/trusted.gpg.d", "/usr/share/keyrings", "/var/lib/rpm"],
+    'grub': ["/boot/grub", "/boot/grub2"],
+    'crontabs': ["/etc/crontab", "/etc/cron.d", "/etc/cron.hourly", "/etc/cron.daily", "/etc/cron.weekly",
+                 "/etc/cron.monthly", "/var/spool/cron"],
+    'shadow': [SHADOW_FILE],
+}
+
+
+def _read(path):
+    with open(path, "r", errors="replace") as handle:
+        return handle.read()
+
+
+def _read_files(patterns):
+    """Read every file matching the patterns under the current root, keyed by host path."""
+    files = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(host_path(pattern))):
+            if os.path.isfile(path):
+                try:
+                    files["/" + os.path.relpath(path, host_path("/"))] = _read(path)
+                except OSError as error:
+                    files[path] = None
+                    print(f"Error reading {path}: {error.strerror}")
+    return files
+
+
+def _unescape(field):
+    return field.replace("\\040", " ").replace("\\011", "\t").replace("\\012", "\n").replace("\\134", "\\")
+
+
+def parse_mountinfo(text):
+    """Parse /proc/self/mountinfo into entries like the ones `mount` prints."""
+    entries = []
+    for line in text.splitlines():
+        fields = line.split()
+        if "-" not in fields:
+            continue
+        separator = fields.index("-")
+        options = fields[5].split(",")
+        for option in fields[separator + 3].split(",") if len(fields) > separator + 3 else []:
+            if option not in options:
+                options.append(option)
+        entries.append({
+            'source': _unescape(fields[separator + 2]),
+            'target': _unescape(fields[4]),
+            'fstype': fields[separator + 1],
+            'options': options
+        })
+    return entries
+
+
+def format_mount(entry):
+    """Render a mount table entry the way `mount` prints it."""
+    return f"{entry['source']} on {entry['target']} type {entry['fstype']} ({','.join(entry['options'])})"
+
+
+def _parse_os_release(text):
+    fields = {}
+    for line in text.splitlines():
+        if "=" in line:
+            key, value = line.split("=", 1)
+            fields[key.strip()] = value.strip().strip("\"'")
+    return fields
+
+
+@collector("host")
+def collect_host():
+    if is_live():
+        return {
+            'hostname': socket.gethostname(),
+            'os_footprint': f"{distro.id()} {distro.version()} {distro.codename()}"
+        }
+
+    # Images and container filesystems are identified by where they are mounted.
+    os_release = {}
+    for path in ("/etc/os-release", "/usr/lib/os-release"):
+        try:
+            os_release = _parse_os_release(_read(host_path(path)))
+            break
+        except OSError:
+            continue
+    return {
+        'hostname': host_path("/").rstrip("/"),
+        'os_footprint': " ".join(filter(None, [os_release.get('ID'), os_release.get('VERSION_ID'), os_release.get('VERSION_CODENAME')]))
+    }
+
+
+@collector("mount_table", live_only=True)
+def collect_mount_table():
+    return parse_mountinfo(_read(MOUNTINFO))
+
+
+@collector("fstab")
+def collect_fstab():
+    try:
+        text = _read(host_path("/etc/fstab"))
+    except OSError:
+        return []
+    return [line for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+def _module_kernel_version():
+    """Newest kernel installed under an alternate root, for modprobe -S."""
+    try:
+        versions = sorted(os.listdir(host_path("/lib/modules")))
+    except OSError:
+        return None
+    return versions[-1] if versions else None
+
+
+@collector("module_state")
+def collect_module_state():
+    loaded = []
+    modprobe = "modprobe"
+    if is_live():
+        try:
+            loaded = _read("/proc/modules").splitlines()
+        except OSError:
+            pass
+    else:
+        # Resolve against the image's modules and modprobe.d; nothing is loaded there.
+        modprobe = f"modprobe -d {host_path('/')} -C {host_path('/etc/modprobe.d')}"
+        kernel_version = _module_kernel_version()
+        if kernel_version:
+            modprobe += f" -S {kernel_version}"
+
+    modules = {}
+    for module in KERNEL_MODULES:
+        name = module.replace("-", "_")
+        modules[module] = {
+            'modprobe': run_command(f"{modprobe} -n -v {module}"),
+            'lsmod': "\n".join(line for line in loaded if line.split(" ", 1)[0] == name)
+        }
+
+    return {
+        'modules': modules,
+        'modprobe_d': _read_files(os.path.join(directory, "*.conf") for directory in MODPROBE_DIRS)
+    }
+
+
+@collector("unit_state", commands_only=True)
+def collect_unit_state():
+    if is_live():
+        return {
+            unit: {
+                'is_enabled': run_command(f"systemctl is-enabled {unit}"),
+                'status': run_command(f"systemctl status {unit}")
+            }
+            for unit in SYSTEMD_UNITS
+        }
+
+    # systemctl --root evaluates unit files offline; there is no runtime status.
+    return {
+        unit: {
+            'is_enabled': run_command(f"systemctl --root={host_path('/')} is-enabled {unit}"),
+            'status': {'command': f"systemctl status {unit}", 'stdout': "",
+                       'stderr': "Unit status is not available for an alternate root.", 'returncode': None}
+        }
+        for unit in SYSTEMD_UNITS
+    }
+
+
+def parse_dpkg_status(text):
+    """Parse a dpkg status file into {package: {'status': ..., 'version': ...}}."""
+    packages = {}
+    for paragraph in text.split("\n\n"):
+        fields = {}
+        for line in paragraph.splitlines():
+            if line and not line[0].isspace() and ":" in line:
+                key, value = line.split(":", 1)
+                fields[key] = value.strip()
+        if 'Package' in fields:
+            packages[fields['Package']] = {
+                'status': fields.get('Status', ''),
+                'version': fields.get('Version', '')
+            }
+    return packages
+
+
+@collector("package_inventory")
+def collect_package_inventory():
+    if os.path.isfile(host_path(DPKG_STATUS)):
+        return {'manager': 'dpkg', 'packages': parse_dpkg_status(_read(host_path(DPKG_STATUS)))}
+
+    result = run_command(f"rpm --root {host_path('/')} -qa --qf '%{{NAME}} %{{VERSION}}-%{{RELEASE}}\\n'")
+    packages = {}
+    for line in result['stdout'].splitlines():
+        name, _, version = line.partition(" ")
+        packages[name] = {'status': 'install ok installed', 'version': version}
+    return {'manager': 'rpm', 'packages': packages}
+
+
+def is_package_installed(inventory, package):
+    return inventory['packages'].get(package, {}).get('status', '').endswith(" installed")
+
+
+@collector("package_repos", live_only=True, commands_only=True)
+def collect_package_repos():
+    return {manager: run_command(command) for manager, command in PACKAGE_REPO_COMMANDS.items()}
+
+
+@collector("gpg_keys", live_only=True, commands_only=True)
+def collect_gpg_keys():
+    return {manager: run_command(command) for manager, command in GPG_KEY_COMMANDS.items()}
+
+
+@collector("grub")
+def collect_grub():
+    return load_grub_config([host_path(path) for path in GRUB_CONFIG_PATHS])
+
+
+@collector("shadow")
+def collect_shadow():
+    """Only whether root's password is locked ('*' or '!'); hashes are never kept."""
+    try:
+        with open(host_path(SHADOW_FILE), "r") as shadow:
+            for line in shadow:
+                fields = line.rstrip("\n").split(":")
+                if fields[0] == "root" and len(fields) > 1:
+                    return {'path': SHADOW_FILE, 'root_locked': fields[1] in ("*", "!"), 'error': ""}
+    except OSError as error:
+        return {'path': SHADOW_FILE, 'root_locked': None, 'error': f"{SHADOW_FILE}: {error.strerror}"}
+    return {'path': SHADOW_FILE, 'root_locked': None, 'error': f"{SHADOW_FILE}: no entry for root"}
+
+
+@collector("crontabs")
+def collect_crontabs():
+    if is_live():
+        root_crontab = run_command("crontab -u root -l")
+    else:
+        files = _read_files(ROOT_CRONTAB_FILES)
+        root_crontab = {
+            'command': "read " + " ".join(ROOT_CRONTAB_FILES),
+            'stdout': "\n".join(text for text in files.values() if text).strip(),
+            'stderr': "" if files else "no crontab for root",
+            'returncode': 0 if files else 1
+        }
+    return {
+        'root_crontab': root_crontab,
+        'files': _read_files(CRON_FILES)
+    }
+
+
+@collector("local_filesystems")
+def collect_local_filesystems():
+    """Roots of the filesystem walk: local mounts (like `df --local`), or the alternate root."""
+    if not is_live():
+        return [host_path("/")]
+
+    roots = []
+    for entry in parse_mountinfo(_read(MOUNTINFO)):
+        if entry['fstype'] not in NON_LOCAL_FSTYPES and entry['target'] not in roots:
+            roots.append(entry['target'])
+    return roots
+
+
+def _read_ids(path):
+    """Numeric ids (third field) of a passwd or group file under the current root."""
+    try:
+        text = _read(host_path(path))
+    except OSError:
+        return set()
+    ids = set()
+    for line in text.splitlines():
+        fields = line.split(":")
+        if len(fields) > 2 and fields[2].isdigit():
+            ids.add(int(fields[2]))
+    return ids
+
+
+@collector("filesystem_walk", deps=("local_filesystems",))
+def collect_filesystem_walk(local_filesystems):
+    walk_facts = CHECKED_WALK_FACTS if evidence.FAIL_FAST else None
+    if is_live():
+        return walk(local_filesystems, walk_facts)
+    return walk(local_filesystems, walk_facts, known_uids=_read_ids("/etc/passwd"), known_gids=_read_ids("/etc/group"))
@@ -0,0 +1,95 @@
+import json
+import subprocess
+import threading
+
+from utils import facts
+from utils import profiling
+
+CASSETTE_FORMAT = "cis-benchmark-cassette"
+CASSETTE_VERSION = 2
+
+# While recording, every command and its result is kept here and written to
+# the cassette file; while replaying, results are served from it and nothing
+# is spawned. A command run several times is replayed in recorded order.
+# Facts whose collectors read host files (or walk the filesystem) are
+# recorded as collected and replayed as they are, so a replay reads nothing
+# from the host it runs on.
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+class CassetteError(Exception):
+    pass
+
+
+def _execute(command):
+    with profiling.traced("subprocess", command):
+        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    profiling.count_subprocess(len(result.stdout.encode()) + len(result.stderr.encode()))
+    return {
+        'command': command,
+        'stdout': result.stdout.strip(),
+        'stderr': result.stderr.strip(),
+        'returncode': result.returncode
+    }
+
+
+def run_command(command):
+    """Run a shell command and return its stripped output as a result dict."""
+    cassette = _cassette
+    if cassette is None:
+        return _execute(command)
+
+    if cassette['mode'] == "replay":
+        with _cassette_lock:
+            recorded = cassette['interactions'].get(command)
+            if not recorded:
+                raise CassetteError(f"{cassette['path']}: no recording of `{command}`")
+            position = cassette['positions'].get(command, 0)
+            cassette['positions'][command] = position + 1
+        with profiling.traced("cassette", command):
+            return dict(recorded[min(position, len(recorded) - 1)])
+
+    result = _execute(command)
+    with _cassette_lock:
+        cassette['interactions'].setdefault(command, []).append(result)
+    return result
+
+
+def record_cassette(path):
+    """Record every command run from now on, and the host facts collected
+    (written by save_cassette)."""
+    global _cassette
+    _cassette = {'mode': "record", 'path': path, 'interactions': {}}
+
+
+def replay_cassette(path):
+    """Serve command results and host facts from a recorded cassette instead
+    of running or reading anything."""
+    global _cassette
+    try:
+        with open(path, "r") as handle:
+            cassette = json.load(handle)
+    except (OSError, ValueError) as error:
+        raise CassetteError(f"{path}: not a cassette ({error})")
+    if cassette.get('format') != CASSETTE_FORMAT:
+        raise CassetteError(f"{path}: not a cassette")
+    if cassette.get('version') != CASSETTE_VERSION:
+        raise CassetteError(f"{path}: unsupported cassette version {cassette.get('version')} (expected {CASSETTE_VERSION})")
+    _cassette = {'mode': "replay", 'path': path, 'interactions': cassette['interactions'], 'positions': {}}
+    facts.replay(cassette['facts'])
+
+
+def save_cassette():
+    """Write the recorded commands and host facts to the cassette file and
+    stop recording or replaying."""
+    global _cassette
+    cassette, _cassette = _cassette, None
+    if cassette is None or cassette['mode'] != "record":
+        return
+    recorded = {name: value for name, value in facts.collected().items()
+                if not facts.COLLECTORS[name]['commands_only']}
+    with open(cassette['path'], "w") as handle:
+        json.dump({'format': CASSETTE_FORMAT, 'version': CASSETTE_VERSION,
+                   'interactions': cassette['interactions'], 'facts': recorded}, handle, indent=1, sort_keys=True)
+    print(f"Cassette written: {cassette['path']} ({len(cassette['interactions'])} commands, {len(recorded)} facts)")
@@ -0,0 +1,310 @@
+import csv
+import io
+import os
+import threading
+import uuid
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from utils import profiling
+
+# Database connection settings
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+# One results table per benchmark module, all with the same layout.
+RESULT_TABLES = ["unused_filesystems", "software_updates", "filesystems_integrity", "bootloader_settings"]
+
+RESULT_COLUMNS = ("hostname", "os_footprint", "date", "section", "section_name", "scored", "checklist", "deviation")
+
+# VARCHAR lengths of the result columns as create_table makes them (date is a DATE).
+RESULT_COLUMN_LENGTHS = {'hostname': 255, 'os_footprint': 255, 'section': 50, 'section_name': 255,
+                         'scored': 50, 'checklist': 50, 'deviation': 50}
+
+# Staging for COPY loads. "temp" creates a temporary table in every session
+# that loads (catalog writes under many concurrent loaders); "unlogged"
+# shares one UNLOGGED table per results table, each load tagging its rows.
+STAGING = os.getenv("CIS_STAGING", "temp")
+
+# Tables known to exist, so the schema is checked once per process rather
+# than with a CREATE TABLE IF NOT EXISTS (and its locks) before every write.
+_ensured = set()
+
+# One counter per results table, bumped in the same transaction as every
+# write to it, so readers can tell exactly whether a table changed.
+GENERATION_TABLE = "result_generations"
+
+# Per-run cost of every check and collector (see utils/profiling.py).
+PROFILE_TABLE = "check_profiles"
+
+PROFILE_COLUMNS = ("hostname", "date", "kind", "name", "wall_seconds", "cpu_seconds", "subprocesses",
+                   "output_bytes", "db_write_seconds", "cached")
+
+
+# Long-running processes (the agent) keep a small pool of warm connections
+# instead of connecting for every write.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connect():
+    import psycopg2
+    return psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+
+
+def enable_pool(minconn=1, maxconn=4):
+    """Serve connection() from a thread-safe pool of warm connections."""
+    global _pool
+    from psycopg2.pool import ThreadedConnectionPool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(minconn, maxconn, host=DB_HOST, database=DB_NAME,
+                                           user=DB_USER, password=DB_PASSWORD)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def connection():
+    """A connection from the pool when one is enabled, otherwise a fresh one."""
+    pool = _pool
+    if pool is None:
+        conn = connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except Exception:
+        broken = conn.closed != 0
+        if not broken:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def create_table(cursor, table):
+    create_table_query = f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        hostname VARCHAR(255),
+        os_footprint VARCHAR(255),
+        date DATE,
+        section VARCHAR(50),
+        section_name VARCHAR(255),
+        scored VARCHAR(50),
+        checklist VARCHAR(50),
+        deviation VARCHAR(50),
+        UNIQUE (hostname, date, section)
+    )
+    """
+    cursor.execute(create_table_query)
+
+
+def create_staging_table(cursor, table):
+    cursor.execute(f"""
+    CREATE UNLOGGED TABLE IF NOT EXISTS {table}_load (
+        load_id VARCHAR(32),
+        {", ".join(f"{column} {'DATE' if column == 'date' else 'VARCHAR(255)'}" for column in RESULT_COLUMNS)}
+    )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_load_id ON {table}_load (load_id)")
+
+
+def create_generation_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {GENERATION_TABLE} (
+        table_name VARCHAR(63) PRIMARY KEY,
+        generation BIGINT NOT NULL
+    )
+    """)
+
+
+def bump_generation(cursor, table):
+    """Count a change to table. The row stays locked until the transaction
+    ends, so writers bump it last."""
+    cursor.execute(f"""
+    INSERT INTO {GENERATION_TABLE} (table_name, generation) VALUES (%s, 1)
+    ON CONFLICT (table_name) DO UPDATE SET generation = {GENERATION_TABLE}.generation + 1
+    """, (table,))
+
+
+def table_exists(cursor, name):
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    return cursor.fetchone()[0] is not None
+
+
+def ensure_tables(conn, tables):
+    """Create the tables that do not exist yet, once per process. to_regclass
+    takes no lock, so writers only run DDL when a table is really missing."""
+    missing = [table for table in tables if table not in _ensured]
+    if not missing:
+        return
+    cursor = conn.cursor()
+    if GENERATION_TABLE not in _ensured and not table_exists(cursor, GENERATION_TABLE):
+        create_generation_table(cursor)
+    for table in missing:
+        if not table_exists(cursor, table):
+            create_table(cursor, table)
+        if STAGING == "unlogged" and not table_exists(cursor, f"{table}_load"):
+            create_staging_table(cursor, table)
+    conn.commit()
+    _ensured.update(missing)
+    _ensured.add(GENERATION_TABLE)
+
+
+def _latest(rows):
+    """One row per (hostname, date, section), the last one winning, sorted by
+    that key. ON CONFLICT may not touch the same row twice in one statement,
+    and concurrent writers that lock rows in the same order cannot deadlock."""
+    latest = {}
+    for row in rows:
+        latest[(row[0], str(row[2]), row[3])] = row
+    return [latest[key] for key in sorted(latest)]
+
+
+def _upsert_clause():
+    return """
+    ON CONFLICT (hostname, date, section) DO UPDATE
+    SET os_footprint = EXCLUDED.os_footprint,
+        section_name = EXCLUDED.section_name,
+        scored = EXCLUDED.scored,
+        checklist = EXCLUDED.checklist,
+        deviation = EXCLUDED.deviation
+    """
+
+
+def upsert_rows(cursor, table, rows):
+    from psycopg2.extras import execute_values
+    upsert_query = f"""
+    INSERT INTO {table} ({", ".join(RESULT_COLUMNS)})
+    VALUES %s
+    """ + _upsert_clause()
+    execute_values(cursor, upsert_query, _latest(rows), page_size=1000)
+    bump_generation(cursor, table)
+
+
+def copy_rows(cursor, table, rows, staging=None):
+    """Bulk load rows with COPY into a staging table, then upsert them into the
+    results table in one statement."""
+    staging = staging or STAGING
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = ", ".join(RESULT_COLUMNS)
+
+    if staging == "unlogged":
+        load_id = uuid.uuid4().hex
+        writer.writerows((load_id,) + tuple(row) for row in _latest(rows))
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table}_load (load_id, {columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {table}_load WHERE load_id = %s
+        ORDER BY hostname, date, section
+        """ + _upsert_clause(), (load_id,))
+        # Never committed: other sessions do not see this load's staged rows.
+        cursor.execute(f"DELETE FROM {table}_load WHERE load_id = %s", (load_id,))
+        bump_generation(cursor, table)
+        return
+
+    temporary = f"{table}_staging"
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {temporary} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+    writer.writerows(_latest(rows))
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {temporary} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(f"""
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM {temporary}
+    ORDER BY hostname, date, section
+    """ + _upsert_clause())
+    bump_generation(cursor, table)
+
+
+def write_rows(table, rows, bulk=False):
+    """Create the table if needed, then upsert rows in one transaction."""
+    started = time.perf_counter()
+    try:
+        with profiling.traced("database", f"write {table}", rows=len(rows)), connection() as conn:
+            ensure_tables(conn, [table])
+            cursor = conn.cursor()
+            if bulk:
+                copy_rows(cursor, table, rows)
+            else:
+                upsert_rows(cursor, table, rows)
+            conn.commit()
+        return True
+    except Exception as error:
+        print("Error:", error)
+        return False
+    finally:
+        profiling.count_db_write(time.perf_counter() - started)
+
+
+def create_profile_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+        id SERIAL PRIMARY KEY,
+        hostname VARCHAR(255),
+        date DATE,
+        kind VARCHAR(20),
+        name VARCHAR(255),
+        wall_seconds DOUBLE PRECISION,
+        cpu_seconds DOUBLE PRECISION,
+        subprocesses INTEGER,
+        output_bytes BIGINT,
+        db_write_seconds DOUBLE PRECISION,
+        cached BOOLEAN,
+        UNIQUE (hostname, date, kind, name)
+    )
+    """)
+
+
+def ensure_profile_table(conn):
+    """Create the profile table if it does not exist, checked once per process."""
+    if PROFILE_TABLE in _ensured:
+        return
+    cursor = conn.cursor()
+    if not table_exists(cursor, PROFILE_TABLE):
+        create_profile_table(cursor)
+        conn.commit()
+    _ensured.add(PROFILE_TABLE)
+
+
+def write_profile(run):
+    """Store a run profile next to the results, one row per check or collector."""
+    date = run['started'][:10]
+    rows = [(run['hostname'], date, entry['kind'], entry['name'])
+            + tuple(entry[column] for column in PROFILE_COLUMNS[4:]) for entry in run['spans']]
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            ensure_profile_table(conn)
+            cursor.executemany(f"""
+            INSERT INTO {PROFILE_TABLE} ({", ".join(PROFILE_COLUMNS)})
+            VALUES ({", ".join(["%s"] * len(PROFILE_COLUMNS))})
+            ON CONFLICT (hostname, date, kind, name) DO UPDATE
+            SET {", ".join(f"{column} = EXCLUDED.{column}" for column in PROFILE_COLUMNS[4:])}
+            """, rows)
+            conn.commit()
+        return True
+    except Exception as error:
+        print("Error:", error)
+        return False
@@ -0,0 +1,173 @@
+import contextlib
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import bootloader_settings
+from utils import database
+from utils import facts
+from utils import filesystems_integrity
+from utils import profiling
+from utils import result_cache
+from utils import results
+from utils import snapshot
+from utils import software_updates
+from utils import unused_filesystems
+
+CHECK_MODULES = [unused_filesystems, software_updates, filesystems_integrity, bootloader_settings]
+
+# Rows buffered per table before they are bulk loaded with COPY.
+BATCH_ROWS = 5000
+
+
+def selected_checks(sections=None):
+    return [func for module in CHECK_MODULES for func, _ in module.checks(sections)]
+
+
+def module_table(func):
+    """The results table a check function writes to."""
+    return {module.__name__: module.TABLE_NAME for module in CHECK_MODULES}[func.__module__]
+
+
+def capture_checks(checks, date=None):
+    """Run check functions quietly, returning their result rows instead of writing them.
+
+    Returns (rows, skipped): rows are (table, row) tuples as the checks would
+    have written them, skipped lists the sections whose facts were missing.
+    On this host, checks with unchanged inputs replay their cached result.
+    """
+    rows = []
+    skipped = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), results.capture(rows, date=date):
+        for func in checks:
+            with profiling.span("check", func.section):
+                if not result_cache.run_check(func):
+                    skipped.append(func.section)
+    result_cache.save()
+    return rows, skipped
+
+
+def _run_checks(sections=None, date=None):
+    return capture_checks(selected_checks(sections), date)
+
+
+def evaluate_facts(fact_values, date, sections=None):
+    """Run the selected checks against captured facts (see capture_checks)."""
+    facts.load(fact_values)
+    try:
+        return _run_checks(sections, date)
+    finally:
+        facts.reset()
+
+
+def evaluate_bundle(path, sections=None):
+    """Evaluate one snapshot bundle; runs in a worker process."""
+    bundle = snapshot.read_bundle(path)
+    if 'host' not in bundle['facts']:
+        raise snapshot.BundleError(f"{path}: bundle has no host identity")
+    rows, skipped = evaluate_facts(bundle['facts'], bundle['collected_at'][:10], sections)
+    return path, rows, skipped
+
+
+def find_bundles(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.json.gz")))
+
+
+class RowLoader:
+    """Buffers result rows per table and bulk loads them over one connection."""
+
+    def __init__(self, batch_rows=BATCH_ROWS):
+        self.batch_rows = batch_rows
+        self.buffers = {table: [] for table in database.RESULT_TABLES}
+        self.loaded = 0
+        self.failed = 0
+        self.conn = database.connect()
+        database.ensure_tables(self.conn, database.RESULT_TABLES)
+
+    def add(self, rows):
+        for table, row in rows:
+            self.buffers[table].append(row)
+            if len(self.buffers[table]) >= self.batch_rows:
+                self.flush(table)
+
+    def flush(self, table=None):
+        """Load the buffered rows, one transaction per table. A batch that
+        fails is rolled back, reported and dropped, and loading goes on.
+        Returns False if any batch failed."""
+        ok = True
+        for name in [table] if table else list(self.buffers):
+            rows = self.buffers[name]
+            if not rows:
+                continue
+            self.buffers[name] = []
+            try:
+                with profiling.traced("database", f"copy {name}", rows=len(rows)):
+                    cursor = self.conn.cursor()
+                    database.copy_rows(cursor, name, rows)
+                    self.conn.commit()
+            except Exception as error:
+                print(f"Error loading {len(rows)} results into {name}: {error}")
+                self.failed += len(rows)
+                ok = False
+                if self.conn.closed:
+                    self.conn = database.connect()
+                else:
+                    self.conn.rollback()
+                continue
+            self.loaded += len(rows)
+        return ok
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+
+def scan_root(root, sections=None):
+    """Evaluate a mounted image or extracted rootfs; runs in a worker process."""
+    facts.set_root(root)
+    try:
+        facts.collect(facts.required_facts(selected_checks(sections)) | {"host"})
+        rows, skipped = _run_checks(sections)
+    finally:
+        facts.set_root("/")
+    return root, rows, skipped
+
+
+def _evaluate_in_pool(worker, sources, sections=None, workers=None, batch_rows=BATCH_ROWS):
+    loader = RowLoader(batch_rows)
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(worker, source, sections) for source in sources]
+            for future in as_completed(futures):
+                try:
+                    source, rows, skipped = future.result()
+                except Exception as error:
+                    failed += 1
+                    print("Error:", error)
+                    continue
+                loader.add(rows)
+                if skipped:
+                    print(f"{source}: skipped sections without facts: {', '.join(skipped)}")
+    finally:
+        loader.close()
+
+    print(f"Loaded {loader.loaded} results from {len(sources) - failed} sources ({failed} failed)."
+          + (f" {loader.failed} results could not be loaded." if loader.failed else ""))
+
+
+def evaluate_bundles(directory, sections=None, workers=None, batch_rows=BATCH_ROWS):
+    """Evaluate every bundle in a directory with a process pool and stream the
+    results into the results tables with COPY."""
+    paths = find_bundles(directory)
+    print(f"Evaluating {len(paths)} snapshot bundles from {directory}")
+    if paths:
+        _evaluate_in_pool(evaluate_bundle, paths, sections, workers, batch_rows)
+
+
+def scan_roots(roots, sections=None, workers=None, batch_rows=BATCH_ROWS):
+    """Scan several alternate roots concurrently, one worker process per root."""
+    print(f"Scanning {len(roots)} root filesystems")
+    _evaluate_in_pool(scan_root, roots, sections, workers, batch_rows)
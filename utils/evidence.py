@@ -0,0 +1,42 @@
+import os
+
+# Offending items kept (and printed) per check as evidence. The rest are only
+# counted, so a pathological host cannot make a check hold unbounded output.
+EVIDENCE_LINES = int(os.getenv("CIS_EVIDENCE_LINES", "50"))
+
+# Fail-fast mode, for deployment gates that only need a verdict per section:
+# scans stop at the first offending item and the result is recorded as
+# deviated (early exit) instead of listing everything.
+FAIL_FAST = False
+
+
+class Evidence:
+    """Count of offending items, with the first `limit` of them as a sample."""
+
+    def __init__(self, limit=None):
+        self.limit = EVIDENCE_LINES if limit is None else limit
+        self.count = 0
+        self.sample = []
+
+    def add(self, item):
+        self.count += 1
+        if len(self.sample) < self.limit:
+            self.sample.append(item)
+
+    @property
+    def stop(self):
+        """True once a fail-fast scan has seen enough to decide."""
+        return FAIL_FAST and self.count > 0
+
+    @property
+    def omitted(self):
+        return self.count - len(self.sample)
+
+    def as_dict(self):
+        return {'count': self.count, 'sample': list(self.sample), 'omitted': self.omitted}
+
+    def print(self):
+        for item in self.sample:
+            print(item)
+        if self.omitted:
+            print(f"... and {self.omitted} more (only the first {len(self.sample)} are kept)")
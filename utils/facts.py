@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import os
+import threading
+import time
+
+from utils import profiling
+
+# Fact collection graph.
+#
+# Collectors gather raw host data (mount table, module state, unit state, ...)
+# and are declared once with @collector. Checks declare the facts they read
+# with @check, so a run can compute exactly the facts its selected checks
+# need, each once, in parallel, before any check evaluates.
+
+COLLECTORS = {}
+
+MAX_WORKERS = 8
+
+_cache = {}
+_errors = {}
+_collected_at = {}
+_lock = threading.Lock()
+
+# Set while evaluating a snapshot: facts come only from the snapshot and
+# nothing is collected from the host we happen to run on.
+_offline = False
+
+# Set while replaying a cassette: facts come from the cassette, and only
+# collectors that learn everything through commands (replayed from the
+# cassette too) still run.
+_replaying = False
+
+# Filesystem root the collectors read from. Anything other than "/" means we
+# are scanning a mounted image or an extracted container rootfs, so facts
+# that only exist on a running system (live_only collectors) are unavailable.
+ROOT = "/"
+
+
+class FactUnavailable(Exception):
+    pass
+
+
+def collector(name, deps=(), live_only=False, commands_only=False):
+    """Register a fact collector. It is called with the values of its deps.
+
+    live_only collectors query the running system (mount table, loaded
+    services, ...) and are skipped when scanning an alternate root.
+    commands_only collectors read nothing but command output, so a replayed
+    cassette can run them; the facts of all others are recorded in it.
+    """
+    def register(func):
+        COLLECTORS[name] = {'func': func, 'deps': tuple(deps), 'live_only': live_only,
+                            'commands_only': commands_only}
+        return func
+    return register
+
+
+def set_root(root):
+    """Point file-based collectors at another filesystem root and forget collected facts."""
+    global ROOT
+    reset()
+    ROOT = os.path.abspath(root)
+
+
+def is_live():
+    return ROOT == "/"
+
+
+def is_offline():
+    return _offline
+
+
+def host_path(path):
+    """Map an absolute host path into the current root."""
+    return os.path.join(ROOT, path.lstrip("/"))
+
+
+def check(section, *fact_names):
+    """Declare a check's CIS section and the facts it consumes."""
+    def declare(func):
+        func.section = section
+        func.facts = fact_names
+        return func
+    return declare
+
+
+def _load_collectors():
+    # Collectors register themselves on import.
+    import utils.collectors  # noqa: F401
+
+
+def in_sections(section, sections):
+    """True if a section is selected, either exactly or through a parent ("1.1" selects "1.1.3")."""
+    if not sections:
+        return True
+    return any(section == wanted or section.startswith(wanted + ".") for wanted in sections)
+
+
+def select(checks, sections=None):
+    """Filter a list of (func, title) entries down to the selected sections."""
+    return [(func, title) for func, title in checks if in_sections(func.section, sections)]
+
+
+def _with_dependencies(names):
+    needed = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        pending.extend(COLLECTORS[name]['deps'])
+    return needed
+
+
+def required_facts(checks):
+    """Facts needed by a list of check functions, including collector dependencies."""
+    _load_collectors()
+    return _with_dependencies(name for func in checks for name in getattr(func, 'facts', ()))
+
+
+def collect(names, max_workers=MAX_WORKERS):
+    """Compute the given facts and their dependencies, each at most once.
+
+    Independent collectors run concurrently; a collector starts as soon as all
+    of its dependencies are available.
+    """
+    _load_collectors()
+    needed = _with_dependencies(names)
+
+    with _lock:
+        todo = {name for name in needed if name not in _cache and name not in _errors}
+        if _offline:
+            for name in todo:
+                _errors[name] = FactUnavailable(f"fact '{name}' is not in the snapshot")
+            return
+    if not todo:
+        return
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while todo or running:
+            ready = [name for name in todo
+                     if all(dep in _cache or dep in _errors for dep in COLLECTORS[name]['deps'])]
+            for name in ready:
+                todo.discard(name)
+                running[executor.submit(_run_collector, name)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+
+
+def _run_collector(name):
+    spec = COLLECTORS[name]
+    if spec['live_only'] and not is_live():
+        with _lock:
+            _errors[name] = FactUnavailable(f"fact '{name}' is only available on a running system")
+        return
+    if _replaying and not spec['commands_only']:
+        with _lock:
+            _errors[name] = FactUnavailable(f"fact '{name}' is not in the cassette")
+        return
+    try:
+        args = [get(dep) for dep in spec['deps']]
+        with profiling.span("fact", name):
+            value = spec['func'](*args)
+    except Exception as error:
+        with _lock:
+            _errors[name] = error
+        return
+    with _lock:
+        _cache[name] = value
+        _collected_at[name] = time.monotonic()
+
+
+def get(name):
+    """Return a fact, collecting it (and its dependencies) first if needed."""
+    if name not in _cache and name not in _errors:
+        collect([name])
+    if name in _errors:
+        raise _errors[name]
+    return _cache[name]
+
+
+def unavailable(names):
+    """{name: error} for the facts that cannot be read."""
+    missing = {}
+    for name in names:
+        try:
+            get(name)
+        except Exception as error:
+            missing[name] = error
+    return missing
+
+
+def dependents(names):
+    """The given facts plus every fact that (transitively) depends on them."""
+    _load_collectors()
+    affected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, spec in COLLECTORS.items():
+            if name not in affected and affected.intersection(spec['deps']):
+                affected.add(name)
+                changed = True
+    return affected
+
+
+def invalidate(names):
+    """Forget facts whose inputs changed (and the facts built on them).
+    Returns the set of facts that were dropped."""
+    affected = dependents(names)
+    with _lock:
+        for name in affected:
+            _cache.pop(name, None)
+            _errors.pop(name, None)
+            _collected_at.pop(name, None)
+    return affected
+
+
+def expire(max_age):
+    """Forget collected facts older than max_age seconds (and facts built on them)."""
+    now = time.monotonic()
+    with _lock:
+        stale = [name for name, collected_at in _collected_at.items() if now - collected_at > max_age]
+    return invalidate(stale) if stale else set()
+
+
+def collected():
+    """The facts collected so far, {name: value}."""
+    with _lock:
+        return dict(_cache)
+
+
+def load(values, offline=True):
+    """Replace the collected facts with previously captured ones (a snapshot)."""
+    global _offline
+    with _lock:
+        _cache.clear()
+        _errors.clear()
+        _collected_at.clear()
+        _cache.update(values)
+        _offline = offline
+
+
+def replay(values):
+    """Serve facts recorded in a cassette; of the rest, only commands_only
+    collectors run, and nothing is read from this host."""
+    global _replaying
+    load(values, offline=False)
+    _replaying = True
+
+
+def reset():
+    """Forget every collected fact and go back to collecting from this host."""
+    global _offline, _replaying
+    with _lock:
+        _cache.clear()
+        _errors.clear()
+        _collected_at.clear()
+        _offline = False
+        _replaying = False
@@ -0,0 +1,73 @@
+import grp
+import os
+import pwd
+import stat
+
+# A rule is a max_mode, owner and group, e.g. (0o400, "root", "root") for the
+# bootloader config. max_mode is the most permissive mode allowed (e.g.
+# 0o640); owner and group may be names, ids or None to skip that comparison.
+
+_uid_cache = {}
+_gid_cache = {}
+
+
+def resolve_uid(owner):
+    if owner is None or isinstance(owner, int):
+        return owner
+    if owner not in _uid_cache:
+        try:
+            _uid_cache[owner] = pwd.getpwnam(owner).pw_uid
+        except KeyError:
+            _uid_cache[owner] = None
+    return _uid_cache[owner]
+
+
+def resolve_gid(group):
+    if group is None or isinstance(group, int):
+        return group
+    if group not in _gid_cache:
+        try:
+            _gid_cache[group] = grp.getgrnam(group).gr_gid
+        except KeyError:
+            _gid_cache[group] = None
+    return _gid_cache[group]
+
+
+def evaluate_permissions(path, mode, uid, gid, max_mode, owner=None, group=None):
+    """Compare an already stat'ed file against a rule and return its deviations."""
+    deviations = []
+    if mode is None:
+        deviations.append({'path': path, 'issue': 'missing', 'expected': 'present', 'actual': None})
+        return deviations
+
+    mode = stat.S_IMODE(mode)
+    if max_mode is not None and mode & ~max_mode:
+        deviations.append({'path': path, 'issue': 'mode', 'expected': f"{max_mode:04o}", 'actual': f"{mode:04o}"})
+
+    expected_uid = resolve_uid(owner)
+    if owner is not None and uid != expected_uid:
+        deviations.append({'path': path, 'issue': 'owner', 'expected': owner, 'actual': uid})
+
+    expected_gid = resolve_gid(group)
+    if group is not None and gid != expected_gid:
+        deviations.append({'path': path, 'issue': 'group', 'expected': group, 'actual': gid})
+
+    return deviations
+
+
+def stat_paths(paths, follow_symlinks=True):
+    """Stat every distinct path once, in sorted order so entries of one directory
+    are looked up together. Returns {path: stat_result or OSError}."""
+    stats = {}
+    for path in sorted(set(paths)):
+        try:
+            stats[path] = os.stat(path, follow_symlinks=follow_symlinks)
+        except OSError as error:
+            stats[path] = error
+    return stats
+
+
+def format_deviation(deviation):
+    if deviation['issue'] == 'missing':
+        return f"{deviation['path']}: does not exist"
+    return f"{deviation['path']}: {deviation['issue']} is {deviation['actual']}, expected {deviation['expected']}"
@@ -0,0 +1,154 @@
+import os
+import stat
+
+from utils.evidence import Evidence
+
+# Filesystem types that `df --local` leaves out: network and pseudo filesystems.
+NON_LOCAL_FSTYPES = {
+    "nfs", "nfs4", "cifs", "smbfs", "smb3", "ncpfs", "afs", "ceph", "glusterfs",
+    "fuse.sshfs", "9p", "lustre", "gfs2", "ocfs2",
+    "proc", "sysfs", "devpts", "cgroup", "cgroup2", "securityfs", "pstore",
+    "debugfs", "tracefs", "configfs", "fusectl", "mqueue", "hugetlbfs", "bpf",
+    "autofs", "binfmt_misc", "rpc_pipefs", "nsfs", "efivarfs", "selinuxfs",
+}
+
+_known_uids = None
+_known_gids = None
+
+
+def _load_ids():
+    global _known_uids, _known_gids
+    import grp
+    import pwd
+    _known_uids = {entry.pw_uid for entry in pwd.getpwall()}
+    _known_gids = {entry.gr_gid for entry in grp.getgrall()}
+
+
+def _world_writable_dir_without_sticky(path, st):
+    return stat.S_ISDIR(st.st_mode) and st.st_mode & 0o002 and not st.st_mode & stat.S_ISVTX
+
+
+def _world_writable_file(path, st):
+    return stat.S_ISREG(st.st_mode) and st.st_mode & 0o002
+
+
+def _suid_file(path, st):
+    return stat.S_ISREG(st.st_mode) and st.st_mode & stat.S_ISUID
+
+
+def _sgid_file(path, st):
+    return stat.S_ISREG(st.st_mode) and st.st_mode & stat.S_ISGID
+
+
+def _unowned(path, st):
+    return st.st_uid not in _known_uids
+
+
+def _ungrouped(path, st):
+    return st.st_gid not in _known_gids
+
+
+# Facts gathered per inode during the walk: name -> predicate(path, lstat result).
+# Every check that audits file metadata reads one of these lists instead of
+# running its own `find`.
+WALK_FACTS = {
+    'world_writable_dirs_without_sticky': _world_writable_dir_without_sticky,
+    'world_writable_files': _world_writable_file,
+    'suid_files': _suid_file,
+    'sgid_files': _sgid_file,
+    'unowned_files': _unowned,
+    'ungrouped_files': _ungrouped,
+}
+
+
+def walk(roots, facts=None, known_uids=None, known_gids=None):
+    """Walk every root once, staying on its device (like `find -xdev`), and
+    evaluate all requested facts against each inode.
+
+    known_uids/known_gids default to this system's users and groups; pass the
+    ids from an image's /etc/passwd and /etc/group when walking its rootfs.
+
+    Matching paths are counted as they are found, but only the first
+    EVIDENCE_LINES per fact are kept, so memory stays bounded however many
+    entries match.
+
+    In fail-fast mode the walk stops as soon as every requested fact has a
+    match, and the result carries 'early_exit': True.
+
+    Returns {'roots': [...], 'entries': count, 'errors': count,
+    'counts': {<fact>: count}, <fact>: [first paths]}.
+    """
+    global _known_uids, _known_gids
+    facts = list(facts or WALK_FACTS)
+    if known_uids is not None or known_gids is not None:
+        _known_uids, _known_gids = set(known_uids or ()), set(known_gids or ())
+    elif 'unowned_files' in facts or 'ungrouped_files' in facts:
+        _load_ids()
+
+    collected = {'roots': list(roots), 'entries': 0, 'errors': 0}
+    found = {name: Evidence() for name in facts}
+    predicates = [(WALK_FACTS[name], found[name]) for name in facts]
+
+    visited = set()
+    for root in roots:
+        if _walk_root(root, predicates, collected, visited):
+            # Fail-fast: every requested fact already has a match.
+            collected['early_exit'] = True
+            break
+
+    collected['counts'] = {name: evidence.count for name, evidence in found.items()}
+    for name, evidence in found.items():
+        collected[name] = evidence.sample
+    return collected
+
+
+def _walk_root(root, predicates, collected, visited):
+    """Walk one root. Returns True if a fail-fast walk stopped early."""
+    try:
+        root_st = os.lstat(root)
+    except OSError:
+        collected['errors'] += 1
+        return False
+    if (root_st.st_dev, root_st.st_ino) in visited:
+        return False
+
+    stack = [root]
+    if _evaluate(root, root_st, predicates, collected) and _decided(predicates):
+        return True
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        collected['errors'] += 1
+                        continue
+                    if st.st_dev != root_st.st_dev:
+                        continue
+                    if _evaluate(entry.path, st, predicates, collected) and _decided(predicates):
+                        return True
+                    if stat.S_ISDIR(st.st_mode):
+                        key = (st.st_dev, st.st_ino)
+                        if key not in visited:
+                            visited.add(key)
+                            stack.append(entry.path)
+        except OSError:
+            collected['errors'] += 1
+    visited.add((root_st.st_dev, root_st.st_ino))
+    return False
+
+
+def _decided(predicates):
+    return all(evidence.stop for _, evidence in predicates)
+
+
+def _evaluate(path, st, predicates, collected):
+    collected['entries'] += 1
+    matched = False
+    for predicate, evidence in predicates:
+        if predicate(path, st):
+            evidence.add(path)
+            matched = True
+    return matched
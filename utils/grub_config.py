@@ -0,0 +1,113 @@
+import os
+import stat
+
+from utils.file_permissions import stat_paths
+
+# Candidate bootloader configs, in the order the active one is looked up.
+GRUB_CONFIG_PATHS = [
+    "/boot/grub/grub.cfg",
+    "/boot/grub2/grub.cfg",
+    "/boot/grub/menu.lst",
+]
+
+# GRUB2_PASSWORD lives in user.cfg next to grub.cfg (grub2-setpassword).
+GRUB_USER_CONFIG = "user.cfg"
+
+
+def find_grub_config(paths=None):
+    """Return the first existing bootloader config path, or None."""
+    for path in paths or GRUB_CONFIG_PATHS:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def parse_grub_config(text):
+    """Parse grub.cfg/menu.lst text in one pass for superusers and password entries."""
+    superusers = []
+    passwords = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        words = line.split()
+        if words[0] == "set" and len(words) > 1 and words[1].startswith("superusers="):
+            value = words[1].split("=", 1)[1] + " " + " ".join(words[2:])
+            superusers.extend(value.strip().strip("\"'").replace(",", " ").split())
+        elif words[0] in ("password", "password_pbkdf2"):
+            # grub2: "password[_pbkdf2] <user> <secret>", legacy grub: "password [--md5] <secret>"
+            user = None
+            if len(words) > 2 and not words[1].startswith("--"):
+                user = words[1]
+            passwords.append({'directive': words[0], 'user': user})
+    return {'superusers': superusers, 'passwords': passwords}
+
+
+def parse_grub_user_config(text):
+    """Return True if a user.cfg text sets GRUB2_PASSWORD."""
+    return any(line.strip().startswith("GRUB2_PASSWORD=") and line.strip() != "GRUB2_PASSWORD="
+               for line in text.splitlines())
+
+
+def _read(path):
+    with open(path, "r", errors="replace") as handle:
+        return handle.read()
+
+
+def load_grub_config(paths=None):
+    """Locate the active bootloader config once, stat it and parse it.
+
+    Returns a dict describing the config: its path, real mode/uid/gid, the
+    superusers and password entries found in it and whether user.cfg sets
+    GRUB2_PASSWORD. Missing or unreadable files are reported in 'errors'.
+    """
+    model = {
+        'path': None,
+        'mode': None,
+        'uid': None,
+        'gid': None,
+        'superusers': [],
+        'passwords': [],
+        'user_cfg': None,
+        'grub2_password': False,
+        'errors': [],
+    }
+
+    path = find_grub_config(paths)
+    if path is None:
+        model['errors'].append("No bootloader config found in: " + ", ".join(paths or GRUB_CONFIG_PATHS))
+        return model
+
+    model['path'] = path
+    st = stat_paths([path])[path]
+    if isinstance(st, OSError):
+        model['errors'].append(f"{path}: {st.strerror}")
+    else:
+        model['mode'] = stat.S_IMODE(st.st_mode)
+        model['uid'] = st.st_uid
+        model['gid'] = st.st_gid
+
+    try:
+        model.update(parse_grub_config(_read(path)))
+    except OSError as error:
+        model['errors'].append(f"{path}: {error.strerror}")
+
+    user_cfg = os.path.join(os.path.dirname(path), GRUB_USER_CONFIG)
+    if os.path.isfile(user_cfg):
+        model['user_cfg'] = user_cfg
+        try:
+            model['grub2_password'] = parse_grub_user_config(_read(user_cfg))
+        except OSError as error:
+            model['errors'].append(f"{user_cfg}: {error.strerror}")
+
+    return model
+
+
+def is_password_set(model):
+    """A password is set when a superuser has a password entry, GRUB2_PASSWORD is set,
+    or (legacy grub) menu.lst carries a global password line."""
+    if model['grub2_password']:
+        return True
+    if model['path'] and model['path'].endswith("menu.lst"):
+        return bool(model['passwords'])
+    return bool(model['superusers']) and bool(model['passwords'])
@@ -0,0 +1,266 @@
+import ipaddress
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import database
+from utils import profiling
+
+# Agents send their results here instead of connecting to Postgres; only the
+# ingestion server holds database credentials. A shared token keeps
+# strangers from writing results.
+INGEST_TOKEN = os.getenv("CIS_INGEST_TOKEN")
+
+# Batches from many hosts are coalesced in memory and loaded with one COPY per
+# table once this many rows are waiting, or after FLUSH_INTERVAL seconds.
+FLUSH_ROWS = 20000
+FLUSH_INTERVAL = 2.0
+
+# An agent gives up on a batch after this long; it is sent again next run.
+SEND_TIMEOUT = 60
+SEND_RETRIES = 3
+
+
+class IngestError(Exception):
+    pass
+
+
+class Ticket:
+    """One accepted batch, acknowledged once the flush containing it committed."""
+
+    def __init__(self, batch_id, results):
+        self.batch_id = batch_id
+        self.results = results
+        self.rows = sum(len(rows) for rows in results.values())
+        self.done = threading.Event()
+        self.error = None
+
+
+class Coalescer:
+    """Buffers rows from concurrent requests and loads them in large batches."""
+
+    def __init__(self, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.buffers = {table: [] for table in database.RESULT_TABLES}
+        self.tickets = []
+        self.pending_rows = 0
+        self.oldest = None
+        self.stopping = False
+        self.loaded = 0
+
+    def add(self, batch_id, results):
+        ticket = Ticket(batch_id, results)
+        with self.condition:
+            for table, rows in results.items():
+                self.buffers[table].extend(tuple(row) for row in rows)
+            self.tickets.append(ticket)
+            self.pending_rows += ticket.rows
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.condition.notify()
+        return ticket
+
+    def _due(self):
+        if not self.tickets:
+            return False
+        return self.pending_rows >= self.flush_rows or time.monotonic() - self.oldest >= self.flush_interval
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self._due() and not (self.stopping and self.tickets):
+                    if self.stopping:
+                        return
+                    timeout = None if self.oldest is None else max(0.0, self.flush_interval - (time.monotonic() - self.oldest))
+                    self.condition.wait(timeout)
+                buffers, tickets = self.buffers, self.tickets
+                self.buffers = {table: [] for table in database.RESULT_TABLES}
+                self.tickets, self.pending_rows, self.oldest = [], 0, None
+            self.flush(buffers, tickets)
+
+    def load(self, buffers, tickets):
+        """Load rows in one transaction. Returns None, or the error that rolled it back."""
+        try:
+            with profiling.traced("database", "ingest flush", batches=len(tickets)), database.connection() as conn:
+                cursor = conn.cursor()
+                # Tables in one order, so concurrent loads lock their
+                # generation rows without deadlocking.
+                for table, rows in sorted(buffers.items()):
+                    if rows:
+                        database.copy_rows(cursor, table, rows)
+                conn.commit()
+        except Exception as error:
+            print("Error:", error)
+            return str(error)
+        self.loaded += sum(ticket.rows for ticket in tickets)
+        return None
+
+    def flush(self, buffers, tickets):
+        error = self.load(buffers, tickets)
+        if error is None or len(tickets) == 1:
+            for ticket in tickets:
+                ticket.error = error
+                ticket.done.set()
+            return
+        # One bad batch must not fail everybody's: load them one at a time,
+        # so only the batches that fail on their own are retried.
+        for ticket in tickets:
+            ticket.error = self.load(ticket.results, [ticket])
+            ticket.done.set()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """POST /results with {"batch_id": ..., "results": {table: [[column, ...], ...]}}.
+
+    The reply is sent once the batch is committed: 200 {"status": "loaded"}.
+    On 503 {"status": "retry"} the agent sends the batch again; loading is an
+    upsert, so a batch that arrives twice does no harm.
+    """
+
+    def do_POST(self):
+        if self.path != "/results":
+            return self.reply(404, {'status': "error", 'error': "not found"})
+        if INGEST_TOKEN and self.headers.get("Authorization") != f"Bearer {INGEST_TOKEN}":
+            return self.reply(401, {'status': "error", 'error': "bad token"})
+        try:
+            batch = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not isinstance(batch, dict):
+                raise IngestError("a batch must be an object with batch_id and results")
+            batch_id, results = batch['batch_id'], batch['results']
+            validate(results)
+        except (ValueError, KeyError, TypeError, IngestError) as error:
+            return self.reply(400, {'status': "error", 'error': str(error)})
+
+        ticket = self.server.coalescer.add(batch_id, results)
+        if not ticket.done.wait(SEND_TIMEOUT):
+            return self.reply(503, {'status': "retry", 'batch_id': batch_id, 'error': "timed out waiting for the database"})
+        if ticket.error:
+            return self.reply(503, {'status': "retry", 'batch_id': batch_id, 'error': ticket.error})
+        self.reply(200, {'status': "loaded", 'batch_id': batch_id, 'rows': ticket.rows})
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def validate(results):
+    """Reject a batch with any row the database would refuse, before it is
+    coalesced with other hosts' batches."""
+    if not isinstance(results, dict):
+        raise IngestError("results must be an object of tables")
+    for table, rows in results.items():
+        if table not in database.RESULT_TABLES:
+            raise IngestError(f"unknown table: {table}")
+        if not isinstance(rows, list):
+            raise IngestError(f"{table}: rows must be a list")
+        for row in rows:
+            if not isinstance(row, list):
+                raise IngestError(f"{table}: a row must be a list of columns, got {row!r}")
+            if len(row) != len(database.RESULT_COLUMNS):
+                raise IngestError(f"{table}: expected {len(database.RESULT_COLUMNS)} columns, got {len(row)}")
+            for column, value in zip(database.RESULT_COLUMNS, row):
+                if not isinstance(value, str):
+                    raise IngestError(f"{table}: {column} must be a string, got {value!r}")
+                if column == "date":
+                    try:
+                        date.fromisoformat(value)
+                    except ValueError:
+                        raise IngestError(f"{table}: date must be YYYY-MM-DD, got {value!r}")
+                elif len(value) > database.RESULT_COLUMN_LENGTHS[column]:
+                    raise IngestError(f"{table}: {column} is longer than {database.RESULT_COLUMN_LENGTHS[column]} characters")
+
+
+class IngestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, coalescer):
+        self.coalescer = coalescer
+        super().__init__(address, IngestHandler)
+
+
+def _loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(host="0.0.0.0", port=8470, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, pool_size=4):
+    """Accept result batches over HTTP and bulk load them through a connection pool.
+    Anywhere but on loopback, CIS_INGEST_TOKEN has to be set."""
+    if not INGEST_TOKEN and not _loopback(host):
+        print(f"Error: set CIS_INGEST_TOKEN to accept results on {host}; without it only loopback addresses are allowed")
+        return
+    database.enable_pool(1, pool_size)
+    with database.connection() as conn:
+        database.ensure_tables(conn, database.RESULT_TABLES)
+
+    coalescer = Coalescer(flush_rows, flush_interval)
+    flusher = threading.Thread(target=coalescer.run)
+    flusher.start()
+    server = IngestServer((host, port), coalescer)
+    print(f"Ingesting results on http://{host}:{port}/results (COPY every {flush_rows} rows or {flush_interval}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        coalescer.stop()
+        flusher.join()
+        database.close_pool()
+        print(f"Loaded {coalescer.loaded} results.")
+
+
+def send_rows(url, rows, token=INGEST_TOKEN, retries=SEND_RETRIES):
+    """Send (table, row) tuples to an ingestion server as one batch and wait
+    for its acknowledgement. Returns True once the server loaded them."""
+    results = {}
+    for table, row in rows:
+        results.setdefault(table, []).append(list(row))
+    body = json.dumps({'batch_id': str(uuid.uuid4()), 'results': results}).encode()
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    for attempt in range(retries):
+        request = urllib.request.Request(url.rstrip("/") + "/results", data=body, headers=headers, method="POST")
+        try:
+            with profiling.traced("database", "ingest send", rows=len(rows)), \
+                    urllib.request.urlopen(request, timeout=SEND_TIMEOUT + 10) as response:
+                reply = json.loads(response.read())
+            if reply.get('status') == "loaded":
+                return True
+        except urllib.error.HTTPError as error:
+            reply = json.loads(error.read() or b"{}")
+            if error.code != 503:
+                print(f"Error: ingestion server rejected the batch: {reply.get('error', error.reason)}")
+                return False
+        except (OSError, ValueError) as error:
+            reply = {'error': str(error)}
+        print(f"Error: ingestion server did not load the batch ({reply.get('error')}); attempt {attempt + 1} of {retries}")
+        time.sleep(2 ** attempt)
+    return False
@@ -0,0 +1,234 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import database
+from utils import evaluator
+
+# Scan jobs shared by any number of worker processes on any number of
+# machines. Workers claim queued jobs with FOR UPDATE SKIP LOCKED, so two
+# workers never take the same job and nobody waits on another's locks.
+JOB_TABLE = "scan_jobs"
+
+JOB_KINDS = {
+    'bundle': evaluator.evaluate_bundle,
+    'root': evaluator.scan_root,
+}
+
+# Jobs claimed per round trip. Each one renews its lease when it starts and
+# is marked done as soon as its results are loaded.
+CLAIM_JOBS = 8
+
+# A job whose lease (started_at) was not renewed for this long belongs to a
+# dead worker and is queued again (or failed, after MAX_ATTEMPTS).
+LEASE_SECONDS = 3600
+
+# While a job runs, a heartbeat thread renews its lease this often, so a
+# scan that takes longer than LEASE_SECONDS is not handed to a second worker.
+HEARTBEAT_SECONDS = 300
+
+MAX_ATTEMPTS = 3
+
+POLL_INTERVAL = 5.0
+
+
+def create_job_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {JOB_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL,
+        source TEXT NOT NULL,
+        sections TEXT[],
+        state VARCHAR(20) NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker VARCHAR(255),
+        results INTEGER,
+        error TEXT,
+        enqueued_at TIMESTAMP NOT NULL DEFAULT now(),
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {JOB_TABLE}_queued ON {JOB_TABLE} (id) WHERE state = 'queued'")
+
+
+def enqueue(kind, sources, sections=None):
+    """Queue one job per source ("evaluate bundle X", "scan root Y")."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"unknown job kind: {kind}")
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        create_job_table(cursor)
+        cursor.executemany(f"INSERT INTO {JOB_TABLE} (kind, source, sections) VALUES (%s, %s, %s)",
+                           [(kind, source, sections) for source in sources])
+        conn.commit()
+    print(f"Queued {len(sources)} {kind} jobs.")
+
+
+def claim(conn, worker, limit=CLAIM_JOBS):
+    """Take up to `limit` queued jobs (oldest first) without blocking on other workers."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    UPDATE {JOB_TABLE}
+    SET state = 'running', worker = %s, started_at = now(), attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM {JOB_TABLE}
+        WHERE state = 'queued'
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, source, sections
+    """, (worker, limit))
+    jobs = cursor.fetchall()
+    conn.commit()
+    return jobs
+
+
+def requeue_stale(conn, lease=LEASE_SECONDS):
+    """Queue again the jobs of workers that died, unless the job has used
+    MAX_ATTEMPTS (a job that kills its worker would otherwise never end)."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    UPDATE {JOB_TABLE}
+    SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+        error = CASE WHEN attempts >= %s THEN 'worker lost on every attempt' ELSE error END,
+        worker = NULL
+    WHERE state = 'running' AND started_at < now() - %s * interval '1 second'
+    """, (MAX_ATTEMPTS, MAX_ATTEMPTS, lease))
+    conn.commit()
+    return cursor.rowcount
+
+
+def renew(conn, job_id, worker):
+    """Renew a claimed job's lease. False if the job is no longer this
+    worker's (its lease ran out and another worker took it)."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    UPDATE {JOB_TABLE} SET started_at = now()
+    WHERE id = %s AND state = 'running' AND worker = %s
+    """, (job_id, worker))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+@contextmanager
+def heartbeat(job_id, worker, interval=HEARTBEAT_SECONDS):
+    """Renew a job's lease from a thread, on its own connection, while the
+    block runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            conn = database.connect()
+        except Exception as error:
+            print(f"[{worker}] job {job_id}: no heartbeat connection: {error}")
+            return
+        try:
+            while not stop.wait(interval):
+                if not renew(conn, job_id, worker):
+                    print(f"[{worker}] job {job_id}: lease lost to another worker")
+                    return
+        except Exception as error:
+            print(f"[{worker}] job {job_id}: heartbeat failed: {error}")
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish(conn, worker, done, failed):
+    """Mark this worker's jobs done ({id: result count}) or failed ({id: error});
+    failed jobs are queued again until they have used MAX_ATTEMPTS. Jobs that
+    another worker has taken over are left alone. Returns the jobs updated."""
+    cursor = conn.cursor()
+    updated = 0
+    for job_id, count in done.items():
+        cursor.execute(f"""
+        UPDATE {JOB_TABLE} SET state = 'done', results = %s, error = NULL, finished_at = now()
+        WHERE id = %s AND state = 'running' AND worker = %s
+        """, (count, job_id, worker))
+        updated += cursor.rowcount
+    for job_id, error in failed.items():
+        cursor.execute(f"""
+        UPDATE {JOB_TABLE}
+        SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END, error = %s, finished_at = now()
+        WHERE id = %s AND state = 'running' AND worker = %s
+        """, (MAX_ATTEMPTS, error, job_id, worker))
+        updated += cursor.rowcount
+    conn.commit()
+    return updated
+
+
+def work(worker=None, claim_jobs=CLAIM_JOBS, poll_interval=POLL_INTERVAL, once=False):
+    """Claim and run jobs until the queue is empty (once) or forever."""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    loader = evaluator.RowLoader()
+    conn = database.connect()
+    try:
+        create_job_table(conn.cursor())
+        conn.commit()
+        while True:
+            requeue_stale(conn)
+            jobs = claim(conn, worker, claim_jobs)
+            if not jobs:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            for job_id, kind, source, sections in jobs:
+                if not renew(conn, job_id, worker):
+                    print(f"[{worker}] job {job_id} ({kind} {source}) was taken over by another worker")
+                    continue
+                with heartbeat(job_id, worker):
+                    try:
+                        _, rows, skipped = JOB_KINDS[kind](source, sections or None)
+                    except Exception as error:
+                        finish(conn, worker, {}, {job_id: str(error)})
+                        print(f"[{worker}] job {job_id} ({kind} {source}) failed: {error}")
+                        continue
+                    if skipped:
+                        print(f"[{worker}] {source}: skipped sections without facts: {', '.join(skipped)}")
+
+                    # Results are committed before the job is marked done; if the
+                    # worker dies in between, the rerun upserts the same rows again.
+                    failed = loader.failed
+                    loader.add(rows)
+                    loader.flush()
+                    if loader.failed > failed:
+                        finish(conn, worker, {}, {job_id: "loading the results failed"})
+                        print(f"[{worker}] job {job_id} ({kind} {source}) failed: its results could not be loaded")
+                        continue
+                    if not finish(conn, worker, {job_id: len(rows)}, {}):
+                        print(f"[{worker}] job {job_id} ({kind} {source}) was taken over by another worker; "
+                              f"its {len(rows)} results were loaded anyway")
+                        continue
+                print(f"[{worker}] job {job_id} ({kind} {source}) done: {len(rows)} results")
+    finally:
+        conn.close()
+        loader.close()
+
+
+def run_workers(processes=None, claim_jobs=CLAIM_JOBS, once=False):
+    """Run several workers on this machine, one process each."""
+    processes = processes or os.cpu_count() or 1
+    workers = [multiprocessing.Process(target=work, kwargs={'claim_jobs': claim_jobs, 'once': once})
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
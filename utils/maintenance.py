@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+
+from utils import database
+
+# Daily results older than this are rolled up into weekly and monthly
+# summaries and removed; weekly summaries are kept for KEEP_WEEKS, monthly
+# ones for good.
+KEEP_DAYS = 90
+KEEP_WEEKS = 104
+
+ROLLUP_TABLE = "result_rollups"
+
+
+def create_rollup_table(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        id SERIAL PRIMARY KEY,
+        source_table VARCHAR(255),
+        period VARCHAR(10),
+        period_start DATE,
+        hostname VARCHAR(255),
+        os_footprint VARCHAR(255),
+        section VARCHAR(50),
+        section_name VARCHAR(255),
+        scored VARCHAR(50),
+        runs INTEGER,
+        compliant_runs INTEGER,
+        last_date DATE,
+        last_checklist VARCHAR(50),
+        UNIQUE (source_table, period, period_start, hostname, section)
+    )
+    """)
+
+
+def rollup(cursor, table, period, cutoff):
+    """Add the daily rows before cutoff to per-host, per-section summaries for
+    each week or month. Counts accumulate, so rows rolled up by an earlier
+    run (and already deleted) stay counted."""
+    cursor.execute(f"""
+    INSERT INTO {ROLLUP_TABLE} (source_table, period, period_start, hostname, os_footprint, section,
+                                section_name, scored, runs, compliant_runs, last_date, last_checklist)
+    SELECT %s, %s, date_trunc(%s, date)::date, hostname,
+           (array_agg(os_footprint ORDER BY date DESC))[1], section,
+           (array_agg(section_name ORDER BY date DESC))[1], (array_agg(scored ORDER BY date DESC))[1],
+           count(*), count(*) FILTER (WHERE checklist = 'Compliant'),
+           max(date), (array_agg(checklist ORDER BY date DESC))[1]
+    FROM {table}
+    WHERE date < %s
+    GROUP BY date_trunc(%s, date), hostname, section
+    ON CONFLICT (source_table, period, period_start, hostname, section) DO UPDATE
+    SET runs = {ROLLUP_TABLE}.runs + EXCLUDED.runs,
+        compliant_runs = {ROLLUP_TABLE}.compliant_runs + EXCLUDED.compliant_runs,
+        os_footprint = CASE WHEN EXCLUDED.last_date >= {ROLLUP_TABLE}.last_date
+                            THEN EXCLUDED.os_footprint ELSE {ROLLUP_TABLE}.os_footprint END,
+        last_checklist = CASE WHEN EXCLUDED.last_date >= {ROLLUP_TABLE}.last_date
+                              THEN EXCLUDED.last_checklist ELSE {ROLLUP_TABLE}.last_checklist END,
+        last_date = greatest({ROLLUP_TABLE}.last_date, EXCLUDED.last_date)
+    """, (table, period, period, cutoff, period))
+    return cursor.rowcount
+
+
+def prune(cursor, table, cutoff):
+    """Remove daily rows before cutoff. Returns how many went."""
+    cursor.execute(f"DELETE FROM {table} WHERE date < %s", (cutoff,))
+    return cursor.rowcount
+
+
+def maintain(keep_days=KEEP_DAYS, keep_weeks=KEEP_WEEKS, reindex=False, tables=None):
+    """Roll up, prune, vacuum and optionally reindex the results tables."""
+    tables = tables or database.RESULT_TABLES
+    # Cut on a month boundary; the week straddling it is completed by a later
+    # run, since summary counts accumulate.
+    cutoff = (date.today() - timedelta(days=keep_days)).replace(day=1)
+    week_cutoff = date.today() - timedelta(weeks=keep_weeks)
+
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        create_rollup_table(cursor)
+        database.create_generation_table(cursor)
+        conn.commit()
+
+        for table in tables:
+            if not database.table_exists(cursor, table):
+                continue
+            # Rolling up and pruning commit together: a row is never both gone and uncounted.
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_date ON {table} (date)")
+            weekly = rollup(cursor, table, "week", cutoff)
+            monthly = rollup(cursor, table, "month", cutoff)
+            pruned = prune(cursor, table, cutoff)
+            database.bump_generation(cursor, table)
+            conn.commit()
+            print(f"{table}: rows before {cutoff} rolled up into {weekly} weekly and {monthly} monthly summaries; {pruned} rows deleted")
+
+        cursor.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE period = 'week' AND period_start < %s", (week_cutoff,))
+        print(f"{ROLLUP_TABLE}: {cursor.rowcount} weekly summaries before {week_cutoff} deleted")
+        conn.commit()
+
+        # VACUUM and REINDEX CONCURRENTLY cannot run inside a transaction.
+        conn.autocommit = True
+        try:
+            for table in list(tables) + [ROLLUP_TABLE]:
+                if not database.table_exists(cursor, table):
+                    continue
+                cursor.execute(f"VACUUM (ANALYZE) {table}")
+                if reindex:
+                    cursor.execute(f"REINDEX TABLE CONCURRENTLY {table}")
+                print(f"{table}: vacuumed" + (" and reindexed" if reindex else ""))
+        finally:
+            conn.autocommit = False
@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where each run's measurements are written: a node_exporter textfile
+# collector file (replaced every run) and one JSON profile per run.
+PROMETHEUS_FILE = os.getenv("CIS_PROMETHEUS_FILE", "/var/lib/node_exporter/textfile_collector/cis_benchmark.prom")
+PROFILE_DIR = os.getenv("CIS_PROFILE_DIR", "/var/lib/cis-benchmark/profiles")
+
+METRICS = ("wall_seconds", "cpu_seconds", "subprocesses", "output_bytes", "db_write_seconds")
+
+# Measurements of the current run, keyed by (kind, name). kind is "check",
+# "fact" (a collector) or "stage" (database flushes, report build).
+_spans = {}
+_run = None
+_lock = threading.Lock()
+_local = threading.local()
+
+# Chrome trace events of the current run, when tracing was asked for.
+_trace = None
+_trace_clock = 0.0
+_thread_names = {}
+
+
+def _new_span(kind, name):
+    return {'kind': kind, 'name': name, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+            'subprocesses': 0, 'output_bytes': 0, 'db_write_seconds': 0.0, 'cached': False}
+
+
+def _current():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def start_trace():
+    """Record a timeline of the run (see write_trace)."""
+    global _trace, _trace_clock
+    with _lock:
+        _trace = []
+        _trace_clock = time.perf_counter()
+        _thread_names.clear()
+
+
+@contextmanager
+def traced(category, name, **args):
+    """Record a block as a complete ("X") event on the current thread's track."""
+    if _trace is None:
+        yield
+        return
+    thread = threading.current_thread()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        finished = time.perf_counter()
+        with _lock:
+            if _trace is not None:
+                _thread_names.setdefault(thread.ident, thread.name)
+                _trace.append({'name': name, 'cat': category, 'ph': "X",
+                               'ts': round((started - _trace_clock) * 1e6, 1),
+                               'dur': round((finished - started) * 1e6, 1),
+                               'pid': os.getpid(), 'tid': thread.ident, 'args': args})
+
+
+def write_trace(path):
+    """Write the recorded timeline in Chrome trace-event format, one track per
+    thread (open it in chrome://tracing or ui.perfetto.dev)."""
+    global _trace
+    with _lock:
+        events, _trace = _trace or [], None
+        names = dict(_thread_names)
+    pid = os.getpid()
+    metadata = [{'name': "process_name", 'ph': "M", 'pid': pid, 'args': {'name': "cis-benchmark"}}]
+    metadata += [{'name': "thread_name", 'ph': "M", 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in names.items()]
+    try:
+        _write_atomically(path, json.dumps({'traceEvents': metadata + events, 'displayTimeUnit': "ms"}))
+        print(f"Trace written: {path} ({len(events)} events)")
+    except OSError as error:
+        print(f"Error writing {path}: {error.strerror}")
+
+
+@contextmanager
+def span(kind, name):
+    """Measure wall and CPU time of a block. Subprocesses, their output and
+    database writes made by this thread inside the block are counted too."""
+    with _lock:
+        entry = _spans.setdefault((kind, name), _new_span(kind, name))
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    _local.stack.append(entry)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        with traced(kind, name):
+            yield entry
+    finally:
+        _local.stack.pop()
+        with _lock:
+            entry['wall_seconds'] += time.perf_counter() - wall
+            entry['cpu_seconds'] += time.thread_time() - cpu
+
+
+def _add(counter, amount, kind="stage", name="unattributed"):
+    entry = _current()
+    with _lock:
+        if entry is None:
+            entry = _spans.setdefault((kind, name), _new_span(kind, name))
+        entry[counter] += amount
+
+
+def count_subprocess(output_bytes):
+    _add('subprocesses', 1)
+    _add('output_bytes', output_bytes)
+
+
+def count_db_write(seconds):
+    _add('db_write_seconds', seconds, name="database")
+
+
+def mark_cached():
+    entry = _current()
+    if entry is not None:
+        entry['cached'] = True
+
+
+def start_run():
+    """Forget the previous run's measurements."""
+    global _run
+    with _lock:
+        _spans.clear()
+        _run = {'started': datetime.now().isoformat(timespec="seconds"), 'clock': time.perf_counter()}
+
+
+def profile():
+    """The current run as a dict, spans ranked by wall time."""
+    with _lock:
+        spans = sorted((dict(entry) for entry in _spans.values()), key=lambda entry: entry['wall_seconds'], reverse=True)
+        run = dict(_run or {'started': None, 'clock': time.perf_counter()})
+    return {
+        'hostname': socket.gethostname(),
+        'started': run['started'],
+        'wall_seconds': round(time.perf_counter() - run['clock'], 6),
+        'spans': spans
+    }
+
+
+def _write_atomically(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as handle:
+        handle.write(text)
+    os.replace(temporary, path)
+
+
+def prometheus_text(run):
+    lines = []
+    for metric in METRICS:
+        name = f"cis_benchmark_{metric}"
+        lines.append(f"# TYPE {name} gauge")
+        for entry in run['spans']:
+            lines.append(f'{name}{{kind="{entry["kind"]}",name="{entry["name"]}"}} {entry[metric]}')
+    lines.append("# TYPE cis_benchmark_cached gauge")
+    for entry in run['spans']:
+        if entry['kind'] == "check":
+            lines.append(f'cis_benchmark_cached{{kind="check",name="{entry["name"]}"}} {int(entry["cached"])}')
+    lines.append("# TYPE cis_benchmark_run_wall_seconds gauge")
+    lines.append(f"cis_benchmark_run_wall_seconds {run['wall_seconds']}")
+    lines.append("# TYPE cis_benchmark_run_timestamp_seconds gauge")
+    lines.append(f"cis_benchmark_run_timestamp_seconds {int(time.time())}")
+    return "\n".join(lines) + "\n"
+
+
+def finish_run(prometheus_file=PROMETHEUS_FILE, profile_dir=PROFILE_DIR):
+    """Write the Prometheus textfile and this run's JSON profile; returns the profile."""
+    run = profile()
+    try:
+        _write_atomically(prometheus_file, prometheus_text(run))
+    except OSError as error:
+        print(f"Error writing {prometheus_file}: {error.strerror}")
+    path = os.path.join(profile_dir, f"profile-{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    try:
+        _write_atomically(path, json.dumps(run, indent=1))
+    except OSError as error:
+        print(f"Error writing {path}: {error.strerror}")
+    return run
+
+
+def print_summary(run, limit=None):
+    """Ranked table of where the run spent its time."""
+    print(f"Profile: {run['wall_seconds']:.3f}s total")
+    print(f"{'kind':<6} {'name':<20} {'wall s':>9} {'cpu s':>9} {'procs':>6} {'out bytes':>10} {'db s':>8}")
+    for entry in run['spans'][:limit]:
+        name = entry['name'] + (" (cached)" if entry['cached'] else "")
+        print(f"{entry['kind']:<6} {name:<20} {entry['wall_seconds']:>9.3f} {entry['cpu_seconds']:>9.3f} "
+              f"{entry['subprocesses']:>6} {entry['output_bytes']:>10} {entry['db_write_seconds']:>8.3f}")
@@ -0,0 +1,271 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from utils import database
+
+# Answers are cached in memory for this many seconds, keyed by the request,
+# so dashboards polling the same views do not scan the tables every time.
+QUERY_CACHE_TTL = 60
+QUERY_CACHE_ENTRIES = 1024
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class QueryError(Exception):
+    pass
+
+
+class ResponseCache:
+    """Replies by request for ttl seconds, the oldest dropped beyond max_entries."""
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, key, body):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, body)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def _results_union():
+    columns = ", ".join(database.RESULT_COLUMNS)
+    return "\nUNION ALL\n".join(f"SELECT {columns} FROM {table}" for table in database.RESULT_TABLES)
+
+
+def _section_filter(sections):
+    """SQL matching the given sections and their subsections, like facts.in_sections."""
+    if not sections:
+        return "TRUE", []
+    clauses, params = [], []
+    for section in sections:
+        clauses.append("(section = %s OR section LIKE %s)")
+        params += [section, section + ".%"]
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, length):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise QueryError("bad cursor")
+    if not isinstance(key, list) or len(key) != length:
+        raise QueryError("bad cursor")
+    return key
+
+
+def _page(rows, limit, key):
+    """Trim the extra row fetched to see whether another page follows."""
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1])) if more else None
+
+
+def hosts(cursor, limit, after=None):
+    """Per host: the latest run, sections checked and sections deviated in it,
+    one page of hosts at a time (keyset on hostname).
+
+    results is read twice, so PostgreSQL would materialize all of it; NOT
+    MATERIALIZED lets both the page and its hosts' rows come from the
+    tables' (hostname, date, section) index instead."""
+    cursor.execute(f"""
+    WITH results AS NOT MATERIALIZED ({_results_union()}),
+    page AS (
+        SELECT DISTINCT hostname FROM results
+        WHERE %(after)s IS NULL OR hostname > %(after)s
+        ORDER BY hostname LIMIT %(limit)s
+    ),
+    latest AS (
+        SELECT DISTINCT ON (hostname, section) hostname, os_footprint, section, date, deviation
+        FROM results WHERE hostname IN (SELECT hostname FROM page)
+        ORDER BY hostname, section, date DESC
+    )
+    SELECT hostname, (array_agg(os_footprint ORDER BY date DESC))[1], max(date), count(*),
+           count(*) FILTER (WHERE deviation LIKE 'Deviated%%')
+    FROM latest GROUP BY hostname ORDER BY hostname
+    """, {'after': after, 'limit': limit + 1})
+    rows, cursor_next = _page(cursor.fetchall(), limit, lambda row: [row[0]])
+    return {'hosts': [{'hostname': hostname, 'os_footprint': footprint, 'last_run': last_run,
+                       'sections': checked, 'deviated': deviated}
+                      for hostname, footprint, last_run, checked, deviated in rows],
+            'next': cursor_next}
+
+
+def host(cursor, hostname, sections=None):
+    """The latest result of every section on one host."""
+    condition, params = _section_filter(sections)
+    cursor.execute(f"""
+    WITH results AS ({_results_union()})
+    SELECT DISTINCT ON (section) section, section_name, date, scored, checklist, deviation
+    FROM results WHERE hostname = %s AND {condition}
+    ORDER BY section, date DESC
+    """, [hostname] + params)
+    rows = cursor.fetchall()
+    if not rows:
+        raise LookupError(f"no results for host {hostname}")
+    return {'hostname': hostname,
+            'sections': [dict(zip(("section", "section_name", "date", "scored", "checklist", "deviation"), row))
+                         for row in rows]}
+
+
+def sections(cursor, sections=None):
+    """Fleet compliance per section, from every host's latest result."""
+    condition, params = _section_filter(sections)
+    cursor.execute(f"""
+    WITH results AS ({_results_union()}),
+    latest AS (
+        SELECT DISTINCT ON (hostname, section) section, section_name, checklist
+        FROM results WHERE {condition}
+        ORDER BY hostname, section, date DESC
+    )
+    SELECT section, (array_agg(section_name))[1], count(*), count(*) FILTER (WHERE checklist = 'Compliant')
+    FROM latest GROUP BY section ORDER BY section
+    """, params)
+    return {'sections': [{'section': section, 'section_name': name, 'hosts': checked, 'compliant': compliant,
+                          'rate': round(compliant / checked, 4)}
+                         for section, name, checked, compliant in cursor.fetchall()]}
+
+
+def deviations(cursor, since, limit, after=None, sections=None):
+    """Deviated results dated since, one page at a time (keyset on
+    hostname, date, section, the order of the results tables' unique index)."""
+    condition, params = _section_filter(sections)
+    keyset = "TRUE"
+    if after:
+        keyset = "(hostname, date, section) > (%s, %s::date, %s)"
+        params = list(after) + params
+    cursor.execute(f"""
+    WITH results AS ({_results_union()})
+    SELECT hostname, date, section, section_name, checklist FROM results
+    WHERE deviation LIKE 'Deviated%%' AND date >= %s AND {keyset} AND {condition}
+    ORDER BY hostname, date, section
+    LIMIT %s
+    """, [since] + params + [limit + 1])
+    rows, cursor_next = _page(cursor.fetchall(), limit, lambda row: [row[0], row[1], row[2]])
+    return {'deviations': [dict(zip(("hostname", "date", "section", "section_name", "checklist"), row))
+                           for row in rows],
+            'next': cursor_next}
+
+
+def _limit(query):
+    try:
+        limit = int(query.get('limit', [PAGE_SIZE])[0])
+    except ValueError:
+        raise QueryError("limit must be a number")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise QueryError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def answer(path, query):
+    """Run the query for a request path and its parameters."""
+    after = query.get('after', [None])[0]
+    selected = query.get('section')
+    parts = [unquote(part) for part in path.strip("/").split("/")]
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if parts == ["hosts"]:
+                return hosts(cursor, _limit(query), after and decode_cursor(after, 1)[0])
+            if len(parts) == 2 and parts[0] == "hosts":
+                return host(cursor, parts[1], selected)
+            if parts == ["sections"]:
+                return sections(cursor, selected)
+            if parts == ["deviations"]:
+                try:
+                    since = date.fromisoformat(query['since'][0])
+                except (KeyError, ValueError):
+                    raise QueryError("since=YYYY-MM-DD is required")
+                return deviations(cursor, since, _limit(query), after and decode_cursor(after, 3), selected)
+        finally:
+            conn.rollback()
+    raise LookupError("not found")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Read-only JSON views of the results tables:
+
+    GET /hosts                         latest run of every host (paginated)
+    GET /hosts/<hostname>              latest result of every section on a host
+    GET /sections                      fleet compliance per section
+    GET /deviations?since=YYYY-MM-DD   deviated results since a date (paginated)
+
+    Lists take limit=N and after=<the previous page's "next">; every view takes
+    section=S (repeatable) to narrow it to some sections.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        key = (url.path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        body = self.server.cache.get(key)
+        if body is not None:
+            return self.reply(200, body, "hit")
+        try:
+            body = json.dumps(answer(url.path, query), default=str).encode()
+        except QueryError as error:
+            return self.reply(400, json.dumps({'error': str(error)}).encode())
+        except LookupError as error:
+            return self.reply(404, json.dumps({'error': str(error)}).encode())
+        except Exception as error:
+            print("Error:", error)
+            return self.reply(503, json.dumps({'error': "database unavailable"}).encode())
+        self.server.cache.put(key, body)
+        self.reply(200, body, "miss")
+
+    def reply(self, code, data, cache=None):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if cache:
+            self.send_header("Cache-Control", f"max-age={self.server.cache.ttl}")
+            self.send_header("X-Cache", cache)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        self.cache = cache
+        super().__init__(address, QueryHandler)
+
+
+def serve(host="127.0.0.1", port=8471, ttl=QUERY_CACHE_TTL, pool_size=4):
+    """Serve the read-only views over HTTP from a pool of warm connections."""
+    database.enable_pool(1, pool_size)
+    server = QueryServer((host, port), ResponseCache(ttl))
+    print(f"Serving results on http://{host}:{port}/ (/hosts, /sections, /deviations; cached for {ttl}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        database.close_pool()
@@ -0,0 +1,196 @@
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from utils import database
+from utils import profiling
+from utils import report_cache
+
+PDF_FILE = "cis_reports.pdf"
+
+REPORT_HEADER = ["Hostname", "OS Footprint", "Date", "Section", "Section Name", "Scored", "Checklist", "Deviation"]
+
+# Every page holds one table of at most PAGE_ROWS results, so reportlab never
+# splits a long table (which gets slower the longer the table) and every
+# page number is known before anything is rendered.
+PAGE_ROWS = 30
+TOC_ROWS = 30
+
+# Hosts are grouped into shards of about this many results. Each shard is
+# rendered to its own PDF by a worker process, and the parts are merged after.
+SHARD_ROWS = 3000
+
+
+def fetch_rows(tables=None):
+    """Every result, ordered by host so each host's rows come together."""
+    tables = tables or database.RESULT_TABLES
+    columns = ", ".join(database.RESULT_COLUMNS)
+    try:
+        with profiling.traced("database", "fetch report rows"), database.connection() as conn:
+            cursor = conn.cursor()
+            tables = [table for table in tables if database.table_exists(cursor, table)]
+            if not tables:
+                return []
+            cursor.execute("\nUNION ALL\n".join(f"SELECT {columns} FROM {table}" for table in tables)
+                           + "\nORDER BY hostname, date, section")
+            return cursor.fetchall()
+    except Exception as error:
+        print("Error:", error)
+        return []
+
+
+def plan(rows, shard_rows=SHARD_ROWS):
+    """Split rows into shards of whole hosts, and number the pages: the table
+    of contents comes first, then every host starting on a new page.
+
+    Returns (toc, shards): toc is [(hostname, results, deviated, first page)],
+    each shard is (first page, [(hostname, rows)])."""
+    hosts = [(hostname, list(host_rows)) for hostname, host_rows in groupby(rows, key=lambda row: row[0])]
+    page = math.ceil(len(hosts) / TOC_ROWS) + 1
+    toc, shards, filled = [], [], shard_rows
+    for hostname, host_rows in hosts:
+        if filled >= shard_rows:
+            shards.append((page, []))
+            filled = 0
+        shards[-1][1].append((hostname, host_rows))
+        filled += len(host_rows)
+        toc.append((hostname, len(host_rows), sum(row[7].startswith("Deviated") for row in host_rows), page))
+        page += math.ceil(len(host_rows) / PAGE_ROWS)
+    return toc, shards
+
+
+def _styles():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    header = [('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+              ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+              ('FONTSIZE', (0, 0), (-1, -1), 7),
+              ('LEADING', (0, 0), (-1, -1), 9),
+              ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+              ('GRID', (0, 0), (-1, -1), 0.5, colors.black)]
+    return colors, TableStyle, header
+
+
+def _toc_flowables(toc):
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, Table
+
+    colors, TableStyle, header = _styles()
+    title = getSampleStyleSheet()['Heading2']
+    flowables = []
+    for start in range(0, len(toc), TOC_ROWS):
+        entries = toc[start:start + TOC_ROWS]
+        flowables.append(Paragraph("Contents", title))
+        table = Table([["Hostname", "Results", "Deviated", "Page"]] + [list(entry) for entry in entries], repeatRows=1)
+        table.setStyle(TableStyle(header))
+        flowables += [table, PageBreak()]
+    return flowables
+
+
+def _host_flowables(hostname, rows):
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, Table
+
+    colors, TableStyle, header = _styles()
+    title = getSampleStyleSheet()['Heading2']
+    pages = math.ceil(len(rows) / PAGE_ROWS)
+    flowables = []
+    for page, start in enumerate(range(0, len(rows), PAGE_ROWS), start=1):
+        chunk = rows[start:start + PAGE_ROWS]
+        style = list(header)
+        for index, row in enumerate(chunk, start=1):
+            style.append(('BACKGROUND', (0, index), (-1, index), colors.pink if row[7].startswith("Deviated") else colors.beige))
+        table = Table([REPORT_HEADER] + [list(row) for row in chunk])
+        table.setStyle(TableStyle(style))
+        heading = hostname + (f" ({page}/{pages})" if pages > 1 else "")
+        flowables += [Paragraph(heading, title), table, PageBreak()]
+    return flowables
+
+
+def render(path, hosts, first_page, toc=None):
+    """Render hosts (and the table of contents, if given) to one PDF whose
+    first page is numbered first_page; runs in a worker process."""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate
+
+    def number_page(canvas, doc):
+        canvas.setFont("Helvetica", 7)
+        canvas.drawRightString(doc.pagesize[0] - 36, 20, str(first_page + canvas.getPageNumber() - 1))
+
+    flowables = _toc_flowables(toc) if toc else []
+    for hostname, rows in hosts:
+        flowables += _host_flowables(hostname, rows)
+    doc = SimpleDocTemplate(path, pagesize=landscape(letter), leftMargin=36, rightMargin=36,
+                            topMargin=36, bottomMargin=36)
+    doc.build(flowables[:-1], onFirstPage=number_page, onLaterPages=number_page)
+    return path
+
+
+def merge(parts, path):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(part)
+    with open(path, "wb") as output:
+        writer.write(output)
+    writer.close()
+
+
+def generate_report(path=PDF_FILE, workers=None, tables=None, shard_rows=SHARD_ROWS):
+    """Render every result to one PDF, one host after another behind a table
+    of contents. Shards are rendered in parallel and merged when pypdf is
+    installed; otherwise the whole report is rendered in this process.
+
+    An unchanged report is copied from the report cache, and only shards
+    whose rows changed are rendered again."""
+    tables = tables or database.RESULT_TABLES
+    layout = [PAGE_ROWS, TOC_ROWS, shard_rows]
+    request = None
+    if report_cache.active():
+        state = report_cache.table_state(tables)
+        if state is not None:
+            request = report_cache.key("report", tables, layout, state)
+            if report_cache.fetch(request, path):
+                print(f"Report unchanged, copied from the report cache: {path}")
+                return
+
+    rows = fetch_rows(tables)
+    toc, shards = plan(rows, shard_rows)
+    try:
+        import pypdf  # noqa: F401
+        parallel = len(shards) > 1 and workers != 1
+    except ImportError:
+        parallel = False
+
+    reused = 0
+    if not parallel:
+        with profiling.traced("report", "render"):
+            render(path, [host for _, hosts in shards for host in hosts], 1, toc)
+    else:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+            parts = [os.path.join(directory, f"part-{index:05d}.pdf") for index in range(len(shards) + 1)]
+            todo = []
+            for part, (first_page, hosts, part_toc) in zip(parts, [(1, [], toc)] + [shard + (None,) for shard in shards]):
+                digest = report_cache.key("shard", layout, first_page, hosts, part_toc)
+                if report_cache.fetch(digest, part):
+                    reused += 1
+                else:
+                    todo.append((digest, part, hosts, first_page, part_toc))
+            with profiling.traced("report", "render shards", shards=len(todo)), \
+                    ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(render, part, hosts, first_page, part_toc): digest
+                           for digest, part, hosts, first_page, part_toc in todo}
+                for future, digest in futures.items():
+                    report_cache.store(digest, future.result())
+            with profiling.traced("report", "merge"):
+                merge(parts, path)
+
+    if request:
+        report_cache.store(request, path)
+    pages = toc[-1][3] + math.ceil(toc[-1][1] / PAGE_ROWS) - 1 if toc else 1
+    print(f"Report generated: {path} ({len(toc)} hosts, {len(rows)} results, {pages} pages"
+          + (f", {len(shards)} shards, {reused} of {len(shards) + 1} parts from the cache" if parallel else "") + ")")
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+
+from utils import database
+
+# Rendered reports (and the shards they are merged from) are kept here, each
+# under a digest of what was asked for and of the rows it was rendered from.
+CACHE_DIR = os.getenv("CIS_REPORT_CACHE", "/var/cache/cis-benchmark/reports")
+
+# Least recently used files are removed once the directory grows past this.
+CACHE_BYTES = 512 * 1024 * 1024
+
+# Bump when the report layout changes so old artifacts are not served.
+CACHE_VERSION = 1
+
+_enabled = True
+_dir = CACHE_DIR
+_max_bytes = CACHE_BYTES
+
+
+def configure(enabled=True, path=CACHE_DIR, max_bytes=CACHE_BYTES):
+    global _enabled, _dir, _max_bytes
+    _enabled, _dir, _max_bytes = enabled, path, max_bytes
+
+
+def active():
+    return _enabled
+
+
+def key(*parts):
+    """Digest of a request: its parameters and whatever state its rows have."""
+    return hashlib.sha256(json.dumps([CACHE_VERSION] + list(parts), default=str).encode()).hexdigest()
+
+
+def table_state(tables):
+    """A cheap fingerprint of the results tables: per table its generation,
+    which every write bumps in the same transaction (see
+    database.bump_generation), or None when the table does not exist.
+    None when the database cannot be asked."""
+    try:
+        with database.connection() as conn:
+            cursor = conn.cursor()
+            state = {table: None for table in tables}
+            if database.table_exists(cursor, database.GENERATION_TABLE):
+                cursor.execute(f"SELECT table_name, generation FROM {database.GENERATION_TABLE} "
+                               "WHERE table_name = ANY(%s)", (list(tables),))
+                state.update(cursor.fetchall())
+            for table in tables:
+                if state[table] is None and database.table_exists(cursor, table):
+                    state[table] = 0
+            conn.commit()
+        return state
+    except Exception as error:
+        print("Error:", error)
+        return None
+
+
+def _entry(digest, suffix):
+    return os.path.join(_dir, digest[:2], digest + suffix)
+
+
+def fetch(digest, path, suffix=".pdf"):
+    """Copy a cached artifact to path. Returns True on a hit."""
+    if not _enabled:
+        return False
+    cached = _entry(digest, suffix)
+    try:
+        shutil.copyfile(cached, path)
+        # The modification time orders the entries for eviction.
+        os.utime(cached)
+    except OSError:
+        return False
+    return True
+
+
+def store(digest, path, suffix=".pdf"):
+    """Keep a copy of a rendered artifact, then evict down to the size limit."""
+    if not _enabled:
+        return
+    cached = _entry(digest, suffix)
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temporary = f"{cached}.{os.getpid()}.tmp"
+        shutil.copyfile(path, temporary)
+        os.replace(temporary, cached)
+    except OSError as error:
+        print(f"Error writing report cache {cached}: {error.strerror}")
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """Remove the least recently used artifacts until the cache fits in max_bytes."""
+    max_bytes = _max_bytes if max_bytes is None else max_bytes
+    entries = []
+    for directory, _, names in os.walk(_dir):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat_result.st_mtime_ns, stat_result.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,223 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from utils import facts
+from utils import profiling
+from utils import results
+from utils.collectors import FACT_INPUTS
+from utils.pretty import pretty_print
+
+# Results of checks whose inputs did not change since they were last
+# evaluated are replayed from this file instead of being computed again.
+CACHE_FILE = os.getenv("CIS_RESULT_CACHE", "/var/cache/cis-benchmark/result_cache.json")
+
+# A cached result is evaluated again once it is this old, changed inputs or not.
+CACHE_TTL = 7 * 86400
+
+# Bump when the fingerprint layout changes so old entries are ignored.
+CACHE_VERSION = 2
+
+_enabled = True
+_ttl = CACHE_TTL
+_path = CACHE_FILE
+_entries = None
+_dirty = False
+# Fingerprints taken before the facts were collected, by section.
+_before = {}
+_lock = threading.Lock()
+_package_digest = None
+
+
+def configure(enabled=True, ttl=CACHE_TTL, path=CACHE_FILE):
+    global _enabled, _ttl, _path, _entries
+    _enabled, _ttl, _path, _entries = enabled, ttl, path, None
+    _before.clear()
+
+
+def active():
+    # Fingerprints describe this host; snapshots and alternate roots are never cached.
+    return _enabled and facts.is_live() and not facts.is_offline()
+
+
+def _proc_state(path):
+    """Files under /proc have no useful mtime; fingerprint their content instead.
+    Only module names matter in /proc/modules, not the reference counts."""
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if path == "/proc/modules":
+        data = b"\n".join(sorted(line.split(b" ", 1)[0] for line in data.splitlines()))
+    return hashlib.sha256(data).hexdigest()
+
+
+def _path_state(path, depth=2):
+    """(inode, size, mtime) of a path; directories include their entries,
+    recursively down to depth levels (systemd's *.wants, grub's platform dirs)."""
+    try:
+        if path.startswith("/proc/"):
+            return [path, _proc_state(path)]
+        stat_result = os.lstat(path)
+    except FileNotFoundError:
+        return [path, None]
+    except OSError as error:
+        return [path, "error", error.errno]
+
+    state = [path, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+    if os.path.islink(path):
+        state.append(os.readlink(path))
+    elif os.path.isdir(path) and depth > 0:
+        try:
+            names = sorted(os.listdir(path))
+        except OSError as error:
+            return state + ["error", error.errno]
+        state.append([_path_state(os.path.join(path, name), depth - 1) for name in names])
+    return state
+
+
+def _code_state(code):
+    # Nested code objects (comprehensions, lambdas) repr with their address.
+    return [code.co_code.hex()] + [_code_state(const) if hasattr(const, 'co_code') else repr(const)
+                                   for const in code.co_consts]
+
+
+def _package_state():
+    """Digest of every module in utils/. Verdicts also depend on the helpers
+    and collectors a check calls, so any shipped code change re-evaluates."""
+    global _package_digest
+    if _package_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as handle:
+                digest.update(handle.read())
+        _package_digest = digest.hexdigest()
+    return _package_digest
+
+
+def fingerprint(func):
+    """Digest of everything a check's result depends on, or None when one of
+    its facts has no declared inputs (it is evaluated every time)."""
+    names = sorted(facts.required_facts([func]))
+    if any(name not in FACT_INPUTS for name in names):
+        return None
+    state = {
+        'version': CACHE_VERSION,
+        'code': _package_state(),
+        'check': [func.__module__, func.__qualname__, _code_state(func.__code__)],
+        'inputs': {name: [_path_state(path) for path in FACT_INPUTS[name]] for name in names}
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(_path, "r") as handle:
+                _entries = json.load(handle)
+        except (OSError, ValueError):
+            _entries = {}
+    return _entries
+
+
+def save():
+    """Write the cache back if anything changed (atomically, via a temporary file)."""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(_path), exist_ok=True)
+            temporary = f"{_path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as handle:
+                json.dump(_entries, handle, indent=1, sort_keys=True)
+            os.replace(temporary, _path)
+            _dirty = False
+        except OSError as error:
+            print(f"Error writing result cache {_path}: {error.strerror}")
+
+
+def _lookup(func):
+    """Fingerprint a check and return (fingerprint, cached entry or None)."""
+    current = fingerprint(func)
+    entry = _load().get(func.section)
+    if current is None or entry is None or entry['fingerprint'] != current:
+        return current, None
+    if time.time() - entry['checked_at'] > _ttl:
+        return current, None
+    return current, entry
+
+
+def pending(checks):
+    """The checks that have to be evaluated (no fresh cached result).
+
+    Call this before collecting facts: the fingerprints taken here are the
+    ones stored with the results."""
+    if not active():
+        return list(checks)
+    todo = []
+    for func in checks:
+        current, entry = _lookup(func)
+        if entry is None:
+            _before.setdefault(func.section, current)
+            todo.append(func)
+    return todo
+
+
+def replay(func):
+    """Record a check's cached result if its inputs are unchanged. Returns True if it did."""
+    if not active():
+        return False
+    _, entry = _lookup(func)
+    if entry is None:
+        return False
+    checked = datetime.fromtimestamp(entry['checked_at']).strftime("%Y-%m-%d %H:%M")
+    pretty_print(f"[{func.section}] {entry['section_name']}: inputs unchanged since {checked}, reusing the cached result")
+    print()
+    profiling.mark_cached()
+    results.record(entry['table'], func.section, entry['section_name'], entry['scored'], entry['compliant'], None)
+    return True
+
+
+def evaluate(func):
+    """Run a check and cache its result, unless its inputs changed while it ran."""
+    global _dirty
+    if not active():
+        func()
+        return
+    before = _before.pop(func.section, None) or fingerprint(func)
+    results.recorded.pop(func.section, None)
+    func()
+    outcome = results.recorded.get(func.section)
+    if before is None or outcome is None or fingerprint(func) != before:
+        return
+    table, section_name, is_scored, is_compliant = outcome
+    with _lock:
+        _load()[func.section] = {
+            'fingerprint': before,
+            'checked_at': time.time(),
+            'table': table,
+            'section_name': section_name,
+            'scored': is_scored,
+            'compliant': is_compliant
+        }
+        _dirty = True
+
+
+def run_check(func):
+    """Replay or evaluate a check. A check whose facts could not be collected
+    is reported and skipped, so the checks after it still run; returns False then."""
+    if replay(func):
+        return True
+    missing = facts.unavailable(func.facts)
+    if missing:
+        for name, error in missing.items():
+            print(f"[{func.section}] skipped: fact '{name}' could not be collected: {error}")
+        print()
+        return False
+    evaluate(func)
+    return True
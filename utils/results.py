@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import database
+from utils import facts
+from utils.pretty import pretty_print
+
+# When set, results are appended here as (table, row) instead of being
+# written to the database (offline evaluation of snapshot bundles).
+_captured = None
+_run_date = None
+
+# Deviation recorded when a fail-fast check stopped at the first violation.
+EARLY_EXIT = "Deviated (early exit)"
+
+# The last outcome recorded for each section:
+# (table, section_name, is_scored, is_compliant). Read by the result cache.
+recorded = {}
+
+
+@contextmanager
+def capture(rows, date=None):
+    """Collect result rows into a list instead of writing them to the database."""
+    global _captured, _run_date
+    previous = (_captured, _run_date)
+    _captured, _run_date = rows, date
+    try:
+        yield rows
+    finally:
+        _captured, _run_date = previous
+
+
+def write(rows):
+    """Write (table, row) results with one upsert per table. Returns the
+    number of rows written."""
+    by_table = {}
+    for table, row in rows:
+        by_table.setdefault(table, []).append(row)
+    written = 0
+    for table, table_rows in by_table.items():
+        if database.write_rows(table, table_rows):
+            written += len(table_rows)
+    return written
+
+
+@contextmanager
+def batch():
+    """Buffer the results recorded inside and write them on the way out, one
+    upsert per table instead of a transaction per check. Inside an active
+    capture, results go to the capture as usual."""
+    if _captured is not None:
+        yield
+        return
+    rows = []
+    try:
+        with capture(rows):
+            yield
+    finally:
+        if rows and write(rows) == len(rows):
+            pretty_print("Data inserted/updated successfully in the database.")
+
+
+def build_row(section, section_name, is_scored, is_compliant, early_exit=False):
+    host = facts.get('host')
+    current_date = _run_date or datetime.now().strftime("%Y-%m-%d")
+    deviation = "Not Deviated" if is_compliant else EARLY_EXIT if early_exit else "Deviated"
+    return (host['hostname'], host['os_footprint'], current_date, section, section_name,
+            "Scored" if is_scored else "Not Scored",
+            "Compliant" if is_compliant else "Not Compliant",
+            deviation)
+
+
+def record(table, section, section_name, is_scored, is_compliant, results):
+    """Store one check result in its module's table (or the active capture)."""
+    recorded[section] = (table, section_name, is_scored, is_compliant)
+    early_exit = isinstance(results, dict) and results.get('early_exit', False)
+    row = build_row(section, section_name, is_scored, is_compliant, early_exit)
+    if _captured is not None:
+        _captured.append((table, row))
+        return
+    if database.write_rows(table, [row]):
+        pretty_print("Data inserted/updated successfully in the database.")
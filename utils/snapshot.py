@@ -0,0 +1,62 @@
+import gzip
+import json
+from datetime import datetime
+
+from utils import facts
+
+# Snapshot bundles hold the raw host facts the checks consume, so evaluation
+# can run somewhere else. Bump BUNDLE_VERSION whenever a collector changes the
+# shape of its fact.
+BUNDLE_FORMAT = "cis-benchmark-snapshot"
+BUNDLE_VERSION = 1
+
+
+class BundleError(Exception):
+    pass
+
+
+def build_bundle(fact_names=None):
+    """Collect facts (all registered ones by default) into a bundle dict."""
+    facts._load_collectors()
+    names = set(fact_names or facts.COLLECTORS) | {"host"}
+    facts.collect(names)
+
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'collected_at': datetime.now().isoformat(timespec="seconds"),
+        'facts': {},
+        'errors': {}
+    }
+    for name in sorted(names):
+        try:
+            bundle['facts'][name] = facts.get(name)
+        except Exception as error:
+            bundle['errors'][name] = f"{type(error).__name__}: {error}"
+    return bundle
+
+
+def write_bundle(path, bundle):
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=9) as handle:
+        json.dump(bundle, handle, separators=(",", ":"))
+
+
+def read_bundle(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            bundle = json.load(handle)
+    except (OSError, ValueError) as error:
+        raise BundleError(f"{path}: not a snapshot bundle ({error})")
+
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"{path}: not a snapshot bundle")
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise BundleError(f"{path}: unsupported bundle version {bundle.get('version')} (expected {BUNDLE_VERSION})")
+    return bundle
+
+
+def collect_snapshot(path, fact_names=None):
+    """Collect host facts and write them to a compressed bundle file."""
+    bundle = build_bundle(fact_names)
+    write_bundle(path, bundle)
+    return bundle
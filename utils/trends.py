@@ -0,0 +1,136 @@
+from datetime import date, timedelta
+
+from utils import database
+from utils.facts import in_sections
+
+# Days of fleet compliance shown by the trend report, and the window of its
+# rolling average.
+TREND_DAYS = 30
+ROLLING_DAYS = 7
+
+DIFF_HEADER = ["Hostname", "Section", "Section Name", "Previous Run", "Previous", "Latest Run", "Latest"]
+
+
+def _results_union():
+    return "\nUNION ALL\n".join(
+        f"SELECT hostname, date, section, section_name, checklist FROM {table}" for table in database.RESULT_TABLES)
+
+
+def _changed_between_runs(cursor, until):
+    """Each host's latest run (on or before until) against its previous run."""
+    cursor.execute(f"""
+    WITH results AS ({_results_union()}),
+    runs AS (
+        SELECT hostname, section, section_name, date, checklist,
+               lag(date) OVER run_order AS previous_date,
+               lag(checklist) OVER run_order AS previous_checklist,
+               row_number() OVER (PARTITION BY hostname, section ORDER BY date DESC) AS recency
+        FROM results
+        WHERE date <= %s
+        WINDOW run_order AS (PARTITION BY hostname, section ORDER BY date)
+    )
+    SELECT hostname, section, section_name, previous_date, previous_checklist, date, checklist
+    FROM runs
+    WHERE recency = 1 AND previous_checklist IS NOT NULL AND previous_checklist <> checklist
+    ORDER BY hostname, section
+    """, (until,))
+    return cursor.fetchall()
+
+
+def _changed_between_dates(cursor, since, until):
+    """Each host's last run on or before since against its last run after it (up to until)."""
+    cursor.execute(f"""
+    WITH results AS ({_results_union()}),
+    ranked AS (
+        SELECT hostname, section, section_name, date, checklist, date <= %(since)s AS before,
+               row_number() OVER (PARTITION BY hostname, section, date <= %(since)s ORDER BY date DESC) AS recency
+        FROM results
+        WHERE date <= %(until)s
+    )
+    SELECT later.hostname, later.section, later.section_name,
+           earlier.date, earlier.checklist, later.date, later.checklist
+    FROM ranked later
+    JOIN ranked earlier ON earlier.hostname = later.hostname AND earlier.section = later.section
+                       AND earlier.before AND earlier.recency = 1
+    WHERE NOT later.before AND later.recency = 1 AND earlier.checklist <> later.checklist
+    ORDER BY later.hostname, later.section
+    """, {'since': since, 'until': until})
+    return cursor.fetchall()
+
+
+def changes(since=None, until=None, sections=None):
+    """Sections whose outcome changed per host: the latest run against the
+    previous one, or the state at `since` against the state at `until`."""
+    until = until or date.today()
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        if since:
+            rows = _changed_between_dates(cursor, since, until)
+        else:
+            rows = _changed_between_runs(cursor, until)
+    return [row for row in rows if in_sections(row[1], sections)]
+
+
+def trend(since=None, sections=None, rolling_days=ROLLING_DAYS):
+    """Per section and day: hosts checked, hosts compliant, the compliance rate,
+    its change from the previous day and a rolling average."""
+    since = since or date.today() - timedelta(days=TREND_DAYS)
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+        WITH results AS ({_results_union()}),
+        daily AS (
+            SELECT section, date, count(*) AS hosts,
+                   count(*) FILTER (WHERE checklist = 'Compliant') AS compliant,
+                   count(*) FILTER (WHERE checklist = 'Compliant')::float / count(*) AS rate
+            FROM results
+            WHERE date >= %s
+            GROUP BY section, date
+        )
+        SELECT section, date, hosts, compliant, rate,
+               rate - lag(rate) OVER (PARTITION BY section ORDER BY date) AS change,
+               avg(rate) OVER (PARTITION BY section ORDER BY date ROWS BETWEEN %s PRECEDING AND CURRENT ROW) AS rolling
+        FROM daily
+        ORDER BY section, date
+        """, (since, rolling_days - 1))
+        rows = cursor.fetchall()
+    return [row for row in rows if in_sections(row[0], sections)]
+
+
+def print_changes(rows):
+    deviated = [row for row in rows if row[6] != "Compliant"]
+    fixed = [row for row in rows if row[6] == "Compliant"]
+    for title, group in (("Newly deviated", deviated), ("Newly compliant", fixed)):
+        print(f"{title}: {len(group)}")
+        for hostname, section, section_name, previous_date, previous, latest_date, latest in group:
+            print(f"  {hostname}  [{section}] {section_name}  {previous_date} {previous} -> {latest_date} {latest}")
+
+
+def print_trend(rows, rolling_days=ROLLING_DAYS):
+    """Print trend() rows; rolling_days is the window they were computed with."""
+    current = None
+    for section, day, hosts, compliant, rate, change, rolling in rows:
+        if section != current:
+            current = section
+            print(f"[{section}]")
+        change_text = f"{change * 100:+.1f}" if change is not None else "    "
+        print(f"  {day}  {compliant:>6}/{hosts:<6} {rate * 100:5.1f}%  {change_text:>6}  ({rolling_days}-day avg {rolling * 100:5.1f}%)")
+
+
+def write_changes_pdf(rows, path):
+    """Render only the changed rows."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+
+    doc = SimpleDocTemplate(path, pagesize=landscape(letter))
+    table = Table([DIFF_HEADER] + [list(row) for row in rows], repeatRows=1)
+    style = [('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+             ('GRID', (0, 0), (-1, -1), 1, colors.black)]
+    for index, row in enumerate(rows, start=1):
+        style.append(('BACKGROUND', (0, index), (-1, index), colors.beige if row[6] == "Compliant" else colors.pink))
+    table.setStyle(TableStyle(style))
+    doc.build([table])
+    print(f"Change report generated: {path} ({len(rows)} changes)")
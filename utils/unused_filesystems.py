@@ -1,97 +1,28 @@
 import inspect
-import os
-from dotenv import load_dotenv
-import subprocess
-from datetime import datetime
-import socket
-import psycopg2
-import distro
+import re
 from utils.pretty import pretty_print, pretty_underline
+from utils import facts
+from utils import profiling
+from utils import result_cache
+from utils import results
+from utils.results import record as record_result
+from utils.collectors import format_mount
+from utils.evidence import Evidence
 #to change from ensure_nodev_on_tmp
-# Database connection settings
-
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-def create_table(cursor):
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS unused_filesystems (
-        id SERIAL PRIMARY KEY,
-        hostname VARCHAR(255),
-        os_footprint VARCHAR(255),
-        date DATE,
-        section VARCHAR(50),
-        section_name VARCHAR(255),
-        scored VARCHAR(50),
-        checklist VARCHAR(50),
-        deviation VARCHAR(50),
-        UNIQUE (hostname, date, section)
-    )
-    """
-    cursor.execute(create_table_query)
-
-def upsert_data(cursor, data):
-    upsert_query = """
-    INSERT INTO unused_filesystems (hostname, os_footprint, date, section, section_name, scored, checklist, deviation)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (hostname, date, section) DO UPDATE
-    SET os_footprint = EXCLUDED.os_footprint,
-        section_name = EXCLUDED.section_name,
-        scored = EXCLUDED.scored,
-        checklist = EXCLUDED.checklist,
-        deviation = EXCLUDED.deviation
-    """
-    cursor.executemany(upsert_query, data)
 
-def get_os_footprint():
-    os_type = distro.id()
-    os_version = distro.version()
-    os_codename = distro.codename()
-    return f"{os_type} {os_version} {os_codename}"
+TABLE_NAME = "unused_filesystems"
 
 def write_output_to_database(section, section_name, is_scored, is_compliant, results):
-    # Get hostname
-    hostname = socket.gethostname()
-
-    # Get OS footprint
-    os_footprint = get_os_footprint()
-
-    # Get current date
-    current_date = datetime.now().strftime("%Y-%m-%d")
-
-    # Determine deviation
-    deviation = "Not Deviated" if is_compliant else "Deviated"
-
-    # Prepare data for insertion
-    data = [(hostname, os_footprint, current_date, section, section_name, 
-             "Scored" if is_scored else "Not Scored", 
-             "Compliant" if is_compliant else "Not Compliant", 
-             deviation)]
+    record_result(TABLE_NAME, section, section_name, is_scored, is_compliant, results)
 
-    # Connect to the database and insert data
-    try:
-        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
-        cursor = conn.cursor()
-
-        # Create table if not exists
-        create_table(cursor)
-
-        # Upsert data
-        upsert_data(cursor, data)
-
-        # Commit the transaction
-        conn.commit()
-        pretty_print("Data inserted/updated successfully in the database.")
-    except (Exception, psycopg2.DatabaseError) as error:
-        print("Error:", error)
-    finally:
-        if conn is not None:
-            conn.close()
+def find_mounts(mount_point, missing_option=None):
+    """Mount table lines for a mount point, optionally only those missing an option."""
+    entries = [entry for entry in facts.get('mount_table') if entry['target'] == mount_point]
+    if missing_option:
+        entries = [entry for entry in entries if missing_option not in entry['options']]
+    return "\n".join(format_mount(entry) for entry in entries)
 
+@facts.check("1.1.1.1", "module_state")
 def ensure_cramfs_disabled():
     section = "1.1.1.1"
     section_name = "Ensure mounting of cramfs filesystems is disabled"
@@ -103,39 +34,31 @@ def ensure_cramfs_disabled():
 
     filesystem = 'cramfs'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/cramfs/cramfs.ko"
     
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -149,6 +72,7 @@ def ensure_cramfs_disabled():
 
 
 
+@facts.check("1.1.1.2", "module_state")
 def ensure_freevxfs_disabled():
     """
     Profile Applicability:
@@ -176,41 +100,32 @@ def ensure_freevxfs_disabled():
 
     filesystem = 'freevxfs'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/freevxfs/freevxfs.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -223,6 +138,7 @@ def ensure_freevxfs_disabled():
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
 
+@facts.check("1.1.1.3", "module_state")
 def ensure_jffs2_disabled():
     """
     Profile Applicability:
@@ -250,41 +166,32 @@ def ensure_jffs2_disabled():
 
     filesystem = 'jffs2'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/jffs2/jffs2.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -296,6 +203,7 @@ def ensure_jffs2_disabled():
     # Write results to database
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
+@facts.check("1.1.1.4", "module_state")
 def ensure_hfs_disabled():
     """
     Profile Applicability:
@@ -323,41 +231,32 @@ def ensure_hfs_disabled():
 
     filesystem = 'hfs'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/hfs/hfs.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -370,6 +269,7 @@ def ensure_hfs_disabled():
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
 
+@facts.check("1.1.1.5", "module_state")
 def ensure_hfsplus_disabled():
     """
     Profile Applicability:
@@ -397,41 +297,32 @@ def ensure_hfsplus_disabled():
     
     filesystem = 'hfsplus'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/hfsplus/hfsplus.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -444,6 +335,7 @@ def ensure_hfsplus_disabled():
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
 
+@facts.check("1.1.1.6", "module_state")
 def ensure_squashfs_disabled():
     """
     Profile Applicability:
@@ -472,41 +364,32 @@ def ensure_squashfs_disabled():
     
     filesystem = 'squashfs'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
-        print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/squashfs/squashfs.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -519,6 +402,7 @@ def ensure_squashfs_disabled():
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
 
+@facts.check("1.1.1.7", "module_state")
 def ensure_udf_disabled():
     """
     Profile Applicability:
@@ -548,41 +432,32 @@ def ensure_udf_disabled():
     
     filesystem = 'udf'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
-        print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/udf/udf.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -596,6 +471,7 @@ def ensure_udf_disabled():
 
 
 #TODO: Add check for UEFI
+@facts.check("1.1.1.8", "module_state")
 def ensure_vfat_disabled():
     """
     Profile Applicability:
@@ -624,41 +500,32 @@ def ensure_vfat_disabled():
     
     filesystem = 'vfat'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
     results = {}
 
-    # Run modprobe command
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    results['modprobe_command'] = modprobe_command
-    results['modprobe_output'] = modprobe_result.stdout.strip()
-    results['modprobe_error'] = modprobe_result.stderr.strip()
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
-        print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
-
-    # Run lsmod command
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    results['lsmod_command'] = lsmod_command
-    results['lsmod_output'] = lsmod_result.stdout.strip()
-    results['lsmod_error'] = lsmod_result.stderr.strip()
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
+    # modprobe dry run
+    print(f"Running command: {modprobe_result['command']}")
+    results['modprobe_command'] = modprobe_result['command']
+    results['modprobe_output'] = modprobe_result['stdout']
+    results['modprobe_error'] = modprobe_result['stderr']
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
+
+    # Loaded modules
+    print(f"Loaded {filesystem} modules:")
+    results['lsmod_output'] = module['lsmod']
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/vfat/vfat.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     if modprobe_disabled and lsmod_disabled:
         print(f"{filesystem} filesystem mounting is disabled")
@@ -670,6 +537,7 @@ def ensure_vfat_disabled():
     # Write results to database
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
+@facts.check("1.1.2", "mount_table", "fstab", "unit_state")
 def ensure_tmp_configured():
     """
     Profile Applicability:
@@ -703,32 +571,36 @@ def ensure_tmp_configured():
     pretty_print(f"[{section}] Ensure /tmp is configured (Scored)")
     print()
 
-    # Collect command outputs
-    results = {}
-    commands = [
-        "mount | grep -E '\\s/tmp\\s'",
-        "grep -E '\\s/tmp\\s' /etc/fstab | grep -E -v '^\\s*#'",
-        "systemctl is-enabled tmp.mount"
-    ]
+    # Collect mount table, fstab and tmp.mount state
+    unit = facts.get('unit_state')['tmp.mount']['is_enabled']
+    results = {
+        'mount': {
+            'output': find_mounts("/tmp"),
+            'error': ""
+        },
+        'fstab': {
+            'output': "\n".join(line for line in facts.get('fstab') if re.search(r'\s/tmp\s', line)),
+            'error': ""
+        },
+        unit['command']: {
+            'output': unit['stdout'],
+            'error': unit['stderr']
+        }
+    }
 
     expected_outputs = [
         "tmpfs on /tmp type tmpfs",
         "tmpfs\t/tmp\ttmpfs",
         "enabled"
     ]
-    
-    for cmd in commands:
-        print(f"Running command: {cmd}")
-        output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        results[cmd] = {
-            'output': output.stdout.strip(),
-            'error': output.stderr.strip()
-        }
-        print(output.stdout)
-        if output.stderr:
+
+    for source, output in results.items():
+        print(f"Checking {source}:")
+        print(output['output'])
+        if output['error']:
             print("Error:")
-            print(output.stderr.strip())
-            pretty_underline(output.stderr, "-")
+            print(output['error'])
+            pretty_underline(output['error'], "-")
 
     # Check configuration status
     for op in expected_outputs:
@@ -746,6 +618,7 @@ def ensure_tmp_configured():
     write_output_to_database(section, section_name, is_scored, is_compliant, results)
 
 
+@facts.check("1.1.3", "mount_table")
 def ensure_nodev_on_tmp():
     """
     Profile Applicability:
@@ -770,16 +643,12 @@ def ensure_nodev_on_tmp():
     pretty_print("[1.1.3] Ensure nodev option set on /tmp partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/tmp\\s' | grep -v nodev"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /tmp mounted without nodev")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/tmp",
+        'output': find_mounts("/tmp", missing_option="nodev"),
+        'error': ""
     }
 
     if not result['output']:
@@ -793,6 +662,7 @@ def ensure_nodev_on_tmp():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
+@facts.check("1.1.4", "mount_table")
 def ensure_nosuid_on_tmp():
     """
     Profile Applicability:
@@ -817,16 +687,12 @@ def ensure_nosuid_on_tmp():
     pretty_print("[1.1.4] Ensure nosuid option set on /tmp partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/tmp\\s' | grep -v nosuid"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /tmp mounted without nosuid")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/tmp",
+        'output': find_mounts("/tmp", missing_option="nosuid"),
+        'error': ""
     }
 
     if not result['output']:
@@ -840,6 +706,7 @@ def ensure_nosuid_on_tmp():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
+@facts.check("1.1.5", "mount_table")
 def ensure_noexec_on_tmp():
     """
     Profile Applicability:
@@ -864,16 +731,12 @@ def ensure_noexec_on_tmp():
     pretty_print("[1.1.5] Ensure noexec option set on /tmp partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/tmp\\s' | grep -v noexec"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /tmp mounted without noexec")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/tmp",
+        'output': find_mounts("/tmp", missing_option="noexec"),
+        'error': ""
     }
 
     if not result['output']:
@@ -888,6 +751,7 @@ def ensure_noexec_on_tmp():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.6", "mount_table")
 def ensure_var_configured():
     """
     Profile Applicability:
@@ -913,18 +777,14 @@ def ensure_var_configured():
     pretty_print("[1.1.6] Ensure separate partition exists for /var (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/var\\s'"
-
     expected_output = "/dev/xvdg1 on /var type ext4"
 
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /var")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/var",
+        'output': find_mounts("/var"),
+        'error': ""
     }
 
     if result['output'] == expected_output:
@@ -940,6 +800,7 @@ def ensure_var_configured():
 
 
 #TODO: Add 1.1.7 - 1.1.12
+@facts.check("1.1.13", "mount_table")
 def ensure_home_configured():
     """
     Profile Applicability:
@@ -965,18 +826,14 @@ def ensure_home_configured():
     pretty_print("[1.1.13] Ensure separate partition exists for /home (Scored)")
     print()
 
-    cmd = "mount | grep /home"
-
     expected_output = "/dev/xvdf1 on /home type ext4"
 
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /home")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/home",
+        'output': find_mounts("/home"),
+        'error': ""
     }
 
     if result['output'] == expected_output:
@@ -990,6 +847,7 @@ def ensure_home_configured():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
+@facts.check("1.1.14", "mount_table")
 def ensure_nodev_on_home():
     """
     Profile Applicability:
@@ -1014,16 +872,12 @@ def ensure_nodev_on_home():
     pretty_print("[1.1.14] Ensure nodev option set on /home partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/home\\s' | grep -v nodev"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /home mounted without nodev")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/home",
+        'output': find_mounts("/home", missing_option="nodev"),
+        'error': ""
     }
 
     if not result['output']:
@@ -1038,6 +892,7 @@ def ensure_nodev_on_home():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.15", "mount_table")
 def ensure_nodev_on_dev_shm():
     """
     Profile Applicability:
@@ -1062,16 +917,12 @@ def ensure_nodev_on_dev_shm():
     pretty_print("[1.1.15] Ensure nodev option set on /dev/shm partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/dev/shm\\s' | grep -v nodev"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /dev/shm mounted without nodev")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/dev/shm",
+        'output': find_mounts("/dev/shm", missing_option="nodev"),
+        'error': ""
     }
 
     if not result['output']:
@@ -1084,6 +935,7 @@ def ensure_nodev_on_dev_shm():
 
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
+@facts.check("1.1.16", "mount_table")
 def ensure_nosuid_on_dev_shm():
     """
     Profile Applicability:
@@ -1108,16 +960,12 @@ def ensure_nosuid_on_dev_shm():
     pretty_print("[1.1.16] Ensure nosuid option set on /dev/shm partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/dev/shm\\s' | grep -v nosuid"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /dev/shm mounted without nosuid")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/dev/shm",
+        'output': find_mounts("/dev/shm", missing_option="nosuid"),
+        'error': ""
     }
 
     if not result['output']:
@@ -1131,6 +979,7 @@ def ensure_nosuid_on_dev_shm():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
+@facts.check("1.1.17", "mount_table")
 def ensure_noexec_on_dev_shm():
     """
     Profile Applicability:
@@ -1155,16 +1004,12 @@ def ensure_noexec_on_dev_shm():
     pretty_print("[1.1.17] Ensure noexec option set on /dev/shm partition (Scored)")
     print()
 
-    cmd = "mount | grep -E '\\s/dev/shm\\s' | grep -v noexec"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    print(f"Command Run: {cmd}")
+    print("Checking mount table for /dev/shm mounted without noexec")
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mount_point': "/dev/shm",
+        'output': find_mounts("/dev/shm", missing_option="noexec"),
+        'error': ""
     }
 
     if not result['output']:
@@ -1178,6 +1023,7 @@ def ensure_noexec_on_dev_shm():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
+@facts.check("1.1.18", "mount_table")
 def ensure_nodev_on_removable_media():
     """
     Profile Applicability:
@@ -1203,24 +1049,35 @@ def ensure_nodev_on_removable_media():
     pretty_print("[1.1.18] Ensure nodev option set on removable media partitions (Not Scored)")
     print()
 
-    cmd = "mount"
+    print("Checking mount table")
 
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    # Mounts are evaluated one at a time; only a sample of the offending ones is kept.
+    mounts = facts.get('mount_table')
+    missing = Evidence()
+    for entry in mounts:
+        line = format_mount(entry)
+        if "nodev" not in line:
+            missing.add(line)
+            if missing.stop:
+                break
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mounts_checked': len(mounts),
+        'missing_nodev': missing.as_dict(),
+        'early_exit': missing.stop,
+        'error': ""
     }
 
-    print(f"Command Run: {cmd}")
-    
     if result['error']:
         print(f"Error:\n{result['error']}")
-    
-    if result['output']:
-        if any("nodev" not in line for line in result['output'].splitlines()):
-            print("nodev option is NOT set on the removable medias.")
+
+    if mounts:
+        if missing.stop:
+            print(f"nodev option is NOT set on the removable medias (stopped at the first violation):")
+            missing.print()
+        elif missing.count:
+            print(f"nodev option is NOT set on the removable medias ({missing.count} of {len(mounts)} mounts):")
+            missing.print()
         else:
             is_compliant = True
             print("nodev option is set on the removable medias.")
@@ -1233,6 +1090,7 @@ def ensure_nodev_on_removable_media():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.19", "mount_table")
 def ensure_nosuid_on_removable_media():
     """
     Profile Applicability:
@@ -1257,24 +1115,34 @@ def ensure_nosuid_on_removable_media():
     pretty_print("[1.1.19] Ensure nosuid option set on removable media partitions (Not Scored)")
     print()
 
-    cmd = "mount"
+    print("Checking mount table")
 
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    mounts = facts.get('mount_table')
+    missing = Evidence()
+    for entry in mounts:
+        line = format_mount(entry)
+        if "nosuid" not in line:
+            missing.add(line)
+            if missing.stop:
+                break
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mounts_checked': len(mounts),
+        'missing_nosuid': missing.as_dict(),
+        'early_exit': missing.stop,
+        'error': ""
     }
 
-    print(f"Command Run: {cmd}")
-
     if result['error']:
         print(f"Error:\n{result['error']}")
-    
-    if result['output']:
-        if any("nosuid" not in line for line in result['output'].splitlines()):
-            print("nosuid option is NOT set on the removable medias.")
+
+    if mounts:
+        if missing.stop:
+            print(f"nosuid option is NOT set on the removable medias (stopped at the first violation):")
+            missing.print()
+        elif missing.count:
+            print(f"nosuid option is NOT set on the removable medias ({missing.count} of {len(mounts)} mounts):")
+            missing.print()
         else:
             is_compliant = True
             print("nosuid option is set on the removable medias.")
@@ -1288,6 +1156,7 @@ def ensure_nosuid_on_removable_media():
 
 
 
+@facts.check("1.1.20", "mount_table")
 def ensure_noexec_on_removable_media():
     """
     Profile Applicability:
@@ -1312,24 +1181,34 @@ def ensure_noexec_on_removable_media():
     pretty_print("[1.1.20] Ensure noexec option set on removable media partitions (Not Scored)")
     print()
 
-    cmd = "mount"
+    print("Checking mount table")
 
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    mounts = facts.get('mount_table')
+    missing = Evidence()
+    for entry in mounts:
+        line = format_mount(entry)
+        if "noexec" not in line:
+            missing.add(line)
+            if missing.stop:
+                break
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'mounts_checked': len(mounts),
+        'missing_noexec': missing.as_dict(),
+        'early_exit': missing.stop,
+        'error': ""
     }
 
-    print(f"Command Run: {cmd}")
-
     if result['error']:
         print(f"Error:\n{result['error']}")
-    
-    if result['output']:
-        if any("noexec" not in line for line in result['output'].splitlines()):
-            print("noexec option is NOT set on the removable medias.")
+
+    if mounts:
+        if missing.stop:
+            print(f"noexec option is NOT set on the removable medias (stopped at the first violation):")
+            missing.print()
+        elif missing.count:
+            print(f"noexec option is NOT set on the removable medias ({missing.count} of {len(mounts)} mounts):")
+            missing.print()
         else:
             is_compliant = True
             print("noexec option is set on the removable medias.")
@@ -1342,6 +1221,7 @@ def ensure_noexec_on_removable_media():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.21", "filesystem_walk")
 def ensure_sticky_bit_on_world_writable_directories():
     """
     Profile Applicability:
@@ -1367,22 +1247,34 @@ def ensure_sticky_bit_on_world_writable_directories():
     pretty_print("[1.1.21] Ensure sticky bit is set on all world-writable directories (Scored)")
     print()
 
-    cmd = "df --local -P | awk '{if (NR!=1) print $6}' | xargs -I '{}' find '{}' -xdev -type d \( -perm -0002 -a ! -perm -1000 \) 2>/dev/null"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    print("Walking local filesystems for world-writable directories without the sticky bit")
+    walk_facts = facts.get('filesystem_walk')
+    offending = Evidence()
+    for path in walk_facts['world_writable_dirs_without_sticky']:
+        offending.add(path)
+    # Bundles collected before the walk capped its matches list every path and have no counts.
+    offending.count = walk_facts.get('counts', {}).get('world_writable_dirs_without_sticky', offending.count)
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'roots': walk_facts['roots'],
+        'entries_scanned': walk_facts['entries'],
+        'offending': offending.as_dict(),
+        'early_exit': walk_facts.get('early_exit', False),
+        'error': f"{walk_facts['errors']} entries could not be read" if walk_facts['errors'] else ""
     }
 
-    print(f"Command Run: {cmd}")
+    print(f"Scanned {walk_facts['entries']} entries under: {' '.join(walk_facts['roots'])}")
 
     if result['error']:
         print(f"Error:\n{result['error']}")
-    
-    if not result['output']:
+    if result['early_exit']:
+        print("Stopped at the first world-writable directory without the sticky bit:")
+        offending.print()
+    elif offending.count:
+        print(f"{offending.count} world-writable directories without the sticky bit:")
+        offending.print()
+
+    if not offending.count:
         is_compliant = True
         print("Sticky bit is set on all world-writable directories.")
     else:
@@ -1394,6 +1286,7 @@ def ensure_sticky_bit_on_world_writable_directories():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.22", "unit_state")
 def ensure_disabled_automounting():
     """
     Profile Applicability:
@@ -1419,17 +1312,15 @@ def ensure_disabled_automounting():
     pretty_print("[1.1.22] Disable Automounting (Scored)")
     print()
 
-    cmd = "systemctl is-enabled autofs"
-
-    output = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    unit = facts.get('unit_state')['autofs']['is_enabled']
 
     result = {
-        'command': cmd,
-        'output': output.stdout.strip(),
-        'error': output.stderr.strip()
+        'command': unit['command'],
+        'output': unit['stdout'],
+        'error': unit['stderr']
     }
 
-    print(f"Command Run: {cmd}")
+    print(f"Command Run: {unit['command']}")
 
     if result['error']:
         print(f"Error:\n{result['error']}\n\nAutomounting is disabled as autofs is not in service.")
@@ -1449,6 +1340,7 @@ def ensure_disabled_automounting():
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
 
+@facts.check("1.1.23", "module_state")
 def ensure_usb_storage_disabled():
     """
     Profile Applicability:
@@ -1478,52 +1370,33 @@ def ensure_usb_storage_disabled():
     
     filesystem = 'usb-storage'
 
-    modprobe_command = f'modprobe -n -v {filesystem}'
-    lsmod_command = f'lsmod | grep {filesystem}'
+    module = facts.get('module_state')['modules'][filesystem]
+    modprobe_result = module['modprobe']
 
-    print(f"Running command: {modprobe_command}")
-    modprobe_result = subprocess.run(modprobe_command, shell=True, capture_output=True, text=True)
-    print(modprobe_result.stdout)
-    if modprobe_result.stderr:
+    print(f"Running command: {modprobe_result['command']}")
+    print(modprobe_result['stdout'])
+    if modprobe_result['stderr']:
         print("Error:")
-        print(modprobe_result.stderr.strip())
-        pretty_underline(modprobe_result.stderr, "-")
+        print(modprobe_result['stderr'])
+        pretty_underline(modprobe_result['stderr'], "-")
 
-    print(f"Running command: {lsmod_command}")
-    lsmod_result = subprocess.run(lsmod_command, shell=True, capture_output=True, text=True)
-    print(lsmod_result.stdout)
-    if lsmod_result.stderr:
-        print("Error:")
-        print(lsmod_result.stderr.strip())
-        pretty_underline(lsmod_result.stderr, "-")
-    else:
-        pretty_underline(lsmod_result.stdout, "-")
+    print(f"Loaded {filesystem} modules:")
+    print(module['lsmod'])
+    pretty_underline(module['lsmod'], "-")
 
     expected_output_modprobe = "insmod /lib/modules/6.5.0-35-generic/kernel/fs/storage/usb-storage.ko"
 
-    modprobe_disabled = expected_output_modprobe in modprobe_result.stdout or not modprobe_result.stdout.strip()
-    lsmod_disabled = not lsmod_result.stdout.strip()
+    modprobe_disabled = expected_output_modprobe in modprobe_result['stdout'] or not modprobe_result['stdout']
+    lsmod_disabled = not module['lsmod']
 
     result = {
-        'command_modprobe': modprobe_command,
-        'output_modprobe': modprobe_result.stdout.strip(),
-        'error_modprobe': modprobe_result.stderr.strip(),
-        'command_lsmod': lsmod_command,
-        'output_lsmod': lsmod_result.stdout.strip(),
-        'error_lsmod': lsmod_result.stderr.strip(),
+        'command_modprobe': modprobe_result['command'],
+        'output_modprobe': modprobe_result['stdout'],
+        'error_modprobe': modprobe_result['stderr'],
+        'output_lsmod': module['lsmod'],
         'compliant_status': "Compliant" if modprobe_disabled and lsmod_disabled else "Not Compliant"
     }
 
-    print(f"Command Run: {modprobe_command}")
-
-    if modprobe_result.stderr:
-        print(f"Error:\n{modprobe_result.stderr.strip()}")
-    
-    print(f"Command Run: {lsmod_command}")
-
-    if lsmod_result.stderr:
-        print(f"Error:\n{lsmod_result.stderr.strip()}")
-
     if modprobe_disabled and lsmod_disabled:
         is_compliant = True
         print(f"USB Access is restricted.")
@@ -1535,26 +1408,37 @@ def ensure_usb_storage_disabled():
     # Output to database
     write_output_to_database(section, section_name, is_scored, is_compliant, result)
 
-def run():
-   
-    pretty_print("[1.1] Filesystem Configuration", upper_underline=True)
-    print()
-
+def checks(sections=None):
     # Get the current module
     current_module = inspect.getmodule(inspect.currentframe())
-    
-    # Get all functions in the current module
-    # functions = inspect.getmembers(current_module, inspect.isfunction)
 
+    # Collect the ensure_* checks in source order
     source_lines, _ = inspect.getsourcelines(current_module)
 
     functions = []
     for line in source_lines:
         if line.strip().startswith('def ensure'):
             func_name = line.split('(')[0].replace('def ', '').strip()
-            functions.append(func_name)
+            functions.append((getattr(current_module, func_name), "[1.1] Filesystem Configuration"))
+
+    return facts.select(functions, sections)
+
+def run(sections=None):
+    selected = checks(sections)
+    if not selected:
+        return
+
+    pretty_print("[1.1] Filesystem Configuration", upper_underline=True)
+    print()
+
+    facts.collect(facts.required_facts(result_cache.pending(func for func, _ in selected)))
+
+    # Results are written once the module's checks are done, in one upsert.
+    with results.batch():
+        for func, _ in selected:
+            with profiling.span("check", func.section):
+                result_cache.run_check(func)
+    result_cache.save()
 
-    for func_name in functions:
-        func = getattr(current_module, func_name)
-        func()
-run()
+if __name__ == "__main__":
+    run()
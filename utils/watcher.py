@@ -0,0 +1,206 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from utils import collectors
+from utils import database
+from utils import evaluator
+from utils import facts
+
+# /proc/self/mountinfo cannot be watched with inotify; the kernel flags it
+# with POLLPRI whenever the mount table changes.
+MOUNTINFO = collectors.MOUNTINFO
+MOUNT_FACTS = ["mount_table", "local_filesystems"]
+
+# Inputs watched with inotify. A change under any of these paths invalidates
+# the fact, and only the checks consuming it are re-run. Files under /proc
+# never raise inotify events.
+WATCHED_INPUTS = {
+    fact: [path for path in paths if not path.startswith("/proc/")]
+    for fact, paths in collectors.FACT_INPUTS.items() if fact not in MOUNT_FACTS
+}
+
+# Seconds between attempts to write results the database refused.
+WRITE_RETRY_INTERVAL = 60
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal inotify(7) binding over libc."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def read(self):
+        """Return the pending (wd, mask, name) events."""
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ResultTracker:
+    """Remembers the last pushed row per (table, section) and writes only changes."""
+
+    def __init__(self):
+        self.last = {}
+        # Changed rows whose write failed, by (table, section); sent again with
+        # the next push unless a newer result replaced them.
+        self.unwritten = {}
+
+    def push(self, rows, force=False):
+        """Write changed rows. Only rows that were written are remembered."""
+        pushed = dict(self.unwritten)
+        for table, row in rows:
+            pushed[(table, row[3])] = row
+        changed = {}
+        for (table, section), row in pushed.items():
+            if force or self.last.get((table, section)) != row:
+                changed.setdefault(table, []).append(row)
+        self.unwritten = {}
+        written = 0
+        for table, table_rows in changed.items():
+            if not database.write_rows(table, table_rows):
+                self.unwritten.update(((table, row[3]), row) for row in table_rows)
+                continue
+            for row in table_rows:
+                self.last[(table, row[3])] = row
+                print(f"[{row[3]}] {row[4]}: {row[6]}")
+            written += len(table_rows)
+        return written
+
+
+def _add_watches(inotify, watches):
+    """Watch each input: directories (and their subdirectories, e.g. *.wants) directly,
+    files through their parent directory so replace-by-rename is seen."""
+    for fact, paths in WATCHED_INPUTS.items():
+        for path in paths:
+            if os.path.isdir(path):
+                targets = [(path, None)] + [(entry.path, None) for entry in os.scandir(path) if entry.is_dir()]
+            elif os.path.isdir(os.path.dirname(path)):
+                targets = [(os.path.dirname(path), os.path.basename(path))]
+            else:
+                continue
+            for directory, name in targets:
+                try:
+                    wd = inotify.add_watch(directory)
+                except OSError as error:
+                    print(f"Not watching {directory}: {error.strerror}")
+                    continue
+                watches.setdefault(wd, []).append((name, fact))
+
+
+def watch(sections=None, debounce=1.0, full_interval=86400):
+    """Evaluate everything once, then re-run only the checks whose inputs change.
+
+    Only results that differ from the last pushed ones are written. A full
+    sweep (including the filesystem walk) still runs every full_interval seconds.
+    """
+    checks = evaluator.selected_checks(sections)
+
+    def sweep(force):
+        facts.reset()
+        facts.collect(facts.required_facts(checks))
+        rows, _ = evaluator.capture_checks(checks)
+        return tracker.push(rows, force=force)
+
+    tracker = ResultTracker()
+    print(f"Initial evaluation of {len(checks)} checks")
+    sweep(force=True)
+    last_sweep = time.monotonic()
+
+    inotify = Inotify()
+    watches = {}
+    _add_watches(inotify, watches)
+
+    poller = select.poll()
+    poller.register(inotify.fd, select.POLLIN)
+    mountinfo = open(MOUNTINFO, "rb")
+    mountinfo.read()
+    poller.register(mountinfo.fileno(), select.POLLPRI | select.POLLERR)
+
+    print(f"Watching {len(watches)} directories for changes")
+    pending = set()
+    deadline = None
+    try:
+        while True:
+            now = time.monotonic()
+            if deadline is not None:
+                timeout = max(0.0, deadline - now)
+            else:
+                timeout = max(0.0, last_sweep + full_interval - now)
+            if tracker.unwritten:
+                timeout = min(timeout, WRITE_RETRY_INTERVAL)
+            for fd, _ in poller.poll(timeout * 1000):
+                if fd == inotify.fd:
+                    for wd, _, name in inotify.read():
+                        for watched_name, fact in watches.get(wd, []):
+                            if watched_name is None or watched_name == name:
+                                pending.add(fact)
+                else:
+                    mountinfo.seek(0)
+                    mountinfo.read()
+                    pending.update(MOUNT_FACTS)
+            if pending and deadline is None:
+                deadline = time.monotonic() + debounce
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                dropped = facts.invalidate(pending)
+                affected = [func for func in checks if dropped.intersection(facts.required_facts([func]))]
+                print(f"Changed inputs: {', '.join(sorted(pending))}; re-running {len(affected)} checks")
+                pending = set()
+                deadline = None
+                facts.collect(facts.required_facts(affected))
+                rows, _ = evaluator.capture_checks(affected)
+                tracker.push(rows)
+            elif deadline is None and now >= last_sweep + full_interval:
+                print("Running scheduled full evaluation")
+                sweep(force=True)
+                last_sweep = time.monotonic()
+            elif deadline is None and tracker.unwritten:
+                print(f"Retrying {len(tracker.unwritten)} results that could not be written")
+                tracker.push([])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mountinfo.close()
+        inotify.close()